@@ -1,77 +1,159 @@
+import argparse
+import csv
 import os
 import pandas as pd
 import datetime
 import shutil
 
-def process_row(canvas_row, zy_df):
-    # Extract email from Canvas row
-    if isinstance(canvas_row['SIS Login ID'], str):
-        email = canvas_row['SIS Login ID'].strip().lower()  # Normalize email for comparison
-    else:
-        return None
-
-    # Check if the 'Student' column is valid (to skip rows like "Points Possible")
-    if ',' not in canvas_row['Student']:
-        return None  # Skip invalid rows
-
-    # Split the 'Student' column into 'Last Name' and 'First Name'
-    last_name, first_name = [name.strip() for name in canvas_row['Student'].split(", ")]
-
-    # Try to find the student in the Zybooks report based on email
-    zybook_entry = zy_df[zy_df['School email'].str.lower() == email]
-
-    if not zybook_entry.empty:
-        # Extract names from Zybooks report and normalize for comparison
-        zy_first_name = zybook_entry["First name"].values[0].strip()
-        zy_last_name = zybook_entry["Last name"].values[0].strip()
-
-        # Compare names (case-sensitive) and update Zybooks with Canvas names if they don't match
-        if zy_first_name != first_name or zy_last_name != last_name:
-            print(f"Name mismatch found for {email}: Updating Zybooks name.")
-            # Update the names in the Zybooks DataFrame with proper capitalization
-            zy_df.loc[zy_df['School email'].str.lower() == email, 'First name'] = first_name
-            zy_df.loc[zy_df['School email'].str.lower() == email, 'Last name'] = last_name
-
-        # Return updated record with the Canvas names and grades
-        return {
-            "Student": canvas_row['Student'],
-            "ID": canvas_row['ID'],
-            "SIS Login ID": canvas_row['SIS Login ID'],
-            "Section": canvas_row['Section'],
-            "First Name": first_name,
-            "Last Name": last_name,
-        }
-    else:
-        # If the email is not found in Zybooks, return None (will handle separately)
-        return None
-
-
-def process_csv(canvas_df, zy_df):
-    processed_rows = []
-    unmatched_rows = []
-
-    # Iterate over each row in the Canvas DataFrame
-    for index, canvas_row in canvas_df.iterrows():
-        # Process each row and build the result
-        processed_row = process_row(canvas_row, zy_df)
-
-        if processed_row:
-            processed_rows.append(processed_row)
-        else:
-            # Add unmatched rows to a separate list for export
-            unmatched_rows.append(canvas_row)
-
-    # Convert the results into DataFrames
-    processed_df = pd.DataFrame(processed_rows)
-    unmatched_df = pd.DataFrame(unmatched_rows)
+CHUNK_ROWS = 50000
+
+# The only columns name reconciliation and the Canvas output read
+CANVAS_COLUMNS = ["Student", "ID", "SIS Login ID", "Section"]
+ZYBOOKS_COLUMNS = ["Last name", "First name", "School email"]
+
+def normalize_emails(emails):
+    # Lowercased, stripped emails; anything that is not a string becomes NaN
+    return emails.map(lambda email: email.strip().lower() if isinstance(email, str) else None)
+
+
+def split_student_names(students):
+    # Split the 'Student' column ("Last, First") into stripped last and first names.
+    # Rows without a comma (like "Points Possible") get NaN names and are skipped.
+    has_comma = students.map(lambda student: isinstance(student, str) and ',' in student)
+    parts = students.where(has_comma).str.split(", ", n=1)
+    return parts.str[0].str.strip(), parts.str[1].str.strip()
+
+
+def zybooks_index(zy_df):
+    # Index the Zybooks report by email once instead of scanning it for every Canvas row
+    zy_emails = zy_df['School email'].str.lower()
+    zy_index = pd.DataFrame({
+        "First name": zy_df["First name"].str.strip(),
+        "Last name": zy_df["Last name"].str.strip(),
+    }).set_index(zy_emails)
+    return zy_index[zy_index.index.notna() & ~zy_index.index.duplicated(keep='first')]
+
+
+def name_corrections(canvas_df, zy_df):
+    # Canvas names for every Zybooks email whose names differ, indexed by email
+    emails = normalize_emails(canvas_df['SIS Login ID'])
+    last_names, first_names = split_student_names(canvas_df['Student'])
+    zy_index = zybooks_index(zy_df)
+
+    matched = emails.notna() & first_names.notna() & emails.isin(zy_index.index)
+    matched_emails = emails[matched]
+
+    # Compare names (case-sensitive) against the first Zybooks entry for each email
+    zy_first = matched_emails.map(zy_index["First name"])
+    zy_last = matched_emails.map(zy_index["Last name"])
+    mismatched = (zy_first != first_names[matched]) | (zy_last != last_names[matched])
+    for email in matched_emails[mismatched]:
+        print(f"Name mismatch found for {email}: Updating Zybooks name.")
+
+    # When several Canvas rows share an email the last one wins, as it did when rows
+    # were updated one at a time
+    corrections = pd.DataFrame({
+        "email": matched_emails,
+        "First name": first_names[matched],
+        "Last name": last_names[matched],
+    })
+    corrections = corrections[corrections["email"].isin(matched_emails[mismatched])]
+    return corrections.drop_duplicates("email", keep='last').set_index("email")
+
+
+def apply_corrections(zy_df, corrections):
+    # Update the Zybooks names with the Canvas names in one pass
+    zy_emails = zy_df['School email'].str.lower()
+    to_update = zy_emails.isin(corrections.index)
+    zy_df.loc[to_update, 'First name'] = zy_emails[to_update].map(corrections["First name"])
+    zy_df.loc[to_update, 'Last name'] = zy_emails[to_update].map(corrections["Last name"])
+
+
+def canvas_outputs(canvas_df, zy_df):
+    emails = normalize_emails(canvas_df['SIS Login ID'])
+    last_names, first_names = split_student_names(canvas_df['Student'])
+    matched = emails.notna() & first_names.notna() & emails.isin(zybooks_index(zy_df).index)
+
+    # Build the results with the Canvas names and grades
+    processed_df = pd.DataFrame({
+        "Student": canvas_df['Student'],
+        "ID": canvas_df['ID'],
+        "SIS Login ID": canvas_df['SIS Login ID'],
+        "Section": canvas_df['Section'],
+        "First Name": first_names,
+        "Last Name": last_names,
+    })[matched].reset_index(drop=True)
+    # If the email is not found in Zybooks, export the Canvas row separately
+    unmatched_df = canvas_df[~matched]
+
+    # Keep the previous output for empty results (no header row)
+    if processed_df.empty:
+        processed_df = pd.DataFrame()
+    if unmatched_df.empty:
+        unmatched_df = pd.DataFrame()
 
     return processed_df, unmatched_df
 
 
-def main():
-    # Automatically find the Zybooks and Canvas files
+def process_csv(canvas_df, zy_df):
+    apply_corrections(zy_df, name_corrections(canvas_df, zy_df))
+    return canvas_outputs(canvas_df, zy_df)
+
+
+def load_canvas(canvas_file):
+    # Only the columns reconciliation reads, with the few section names stored once as
+    # categories; the grade columns are copied from the file for the unmatched rows
+    return pd.read_csv(
+        canvas_file,
+        usecols=CANVAS_COLUMNS,
+        dtype={"Student": str, "SIS Login ID": str, "Section": "category"},
+    )
+
+
+def load_zybooks_names(zybooks_file):
+    # The names and emails of the Zybooks report without its assignment columns
+    return pd.read_csv(zybooks_file, usecols=ZYBOOKS_COLUMNS, dtype=str)
+
+
+def copy_rows(source_file, output_file, rows):
+    # Stream the header and the given data rows of a CSV file into another one
+    rows = set(rows)
+    with open(source_file, newline='') as source, open(output_file, "w", newline='') as output:
+        if not rows:
+            # Keep the previous output for empty results (no header row)
+            output.write("\n")
+            return
+        reader = csv.reader(source)
+        writer = csv.writer(output, lineterminator="\n")
+        writer.writerow(next(reader))
+        # pandas skips blank lines, so only non-blank rows count towards the row numbers
+        position = 0
+        for row in reader:
+            if not row:
+                continue
+            if position in rows:
+                writer.writerow(row)
+            position += 1
+
+
+def write_updated_zybooks(zybooks_file, output_file, corrections, chunksize=CHUNK_ROWS):
+    # Apply the name corrections to the full Zybooks report a chunk at a time, keeping
+    # every cell as the text of the report
+    chunks = pd.read_csv(zybooks_file, dtype=str, keep_default_na=False, chunksize=chunksize)
+    for position, chunk in enumerate(chunks):
+        chunk["School email"] = chunk["School email"].str.lower()
+        apply_corrections(chunk, corrections)
+        chunk.to_csv(output_file, index=False, header=position == 0, mode="w" if position == 0 else "a")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Match Zybooks emails to the Canvas gradebook export.")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_ROWS, help="Zybooks rows held in memory at a time while writing the updated report")
+    args = parser.parse_args(argv)
+
+    # Automatically find the Zybooks and Canvas files, newest first when there are several
     current_year = str(datetime.datetime.now().year)
-    files = os.listdir('.')
+    files = sorted(os.listdir('.'), key=os.path.getmtime, reverse=True)
 
     # Find the Zybooks file (starts with "UCSC")
     zybooks_file_candidates = [f for f in files if f.startswith("UCSC") and f.endswith(".csv")]
@@ -87,18 +169,20 @@ def main():
         raise FileNotFoundError(f"A Canvas Gradebook File has NOT been found.")
     canvas_file = canvas_file_candidates[0]
 
-    # Load Zybooks CSV
-    zy_df = pd.read_csv(zybooks_file)
+    # Load the names and emails of both files; the grade columns stay on disk
+    zy_df = load_zybooks_names(zybooks_file)
 
     # Normalize email case for matching in Zybooks data
     zy_df["School email"] = zy_df["School email"].str.lower()
 
     # Load Canvas CSV
-    canvas_df = pd.read_csv(canvas_file)
+    canvas_df = load_canvas(canvas_file)
     canvas_df["SIS Login ID"] = canvas_df["SIS Login ID"].str.lower()  # Normalize email case
 
-    # Process the CSV row by row
-    result_df, unmatched_df = process_csv(canvas_df, zy_df)
+    # Reconcile the names in one vectorized pass, then build the outputs
+    corrections = name_corrections(canvas_df, zy_df)
+    apply_corrections(zy_df, corrections)
+    result_df, unmatched_df = canvas_outputs(canvas_df, zy_df)
 
     # Define output files
     result_file_name = "canvas_graded_output.csv"
@@ -107,9 +191,10 @@ def main():
 
     # Write the results to new CSV files
     result_df.to_csv(result_file_name, index=False)
-    unmatched_df.to_csv(unmatched_file_name, index=False)
+    # The unmatched rows are copied with all their columns from the Canvas export
+    copy_rows(canvas_file, unmatched_file_name, unmatched_df.index)
     # Save the updated Zybooks data with corrected names
-    zy_df.to_csv(updated_zybooks_file, index=False)
+    write_updated_zybooks(zybooks_file, updated_zybooks_file, corrections, args.chunksize)
 
     print(f"Processed grades have been saved to {result_file_name}")
     print(f"Unmatched emails have been saved to {unmatched_file_name}")
@@ -0,0 +1,396 @@
+import argparse
+import json
+import sys
+
+from Publisher.utils import zyphraser
+from Publisher.utils import canvas_api
+from Publisher.utils.canvas_api import DEFAULT_ENDPOINT, REQUEST_ERRORS, get_students, find_assignment, get_assignments, get_submissions, send_request, bulk_update_grades
+from Publisher.utils.cache import cache_from_args
+from Publisher.utils.cassette import use_cassette
+from Publisher.utils.history import changed_students, history_from_args
+from Publisher.utils.identity import IdentityIndex, grades_by_student, identity_from_args
+from Publisher.utils.late_policy import POLICIES, LatePolicy, plan_penalties
+from Publisher.utils.metrics import metrics
+from Publisher.utils.profiling import profiled
+from Publisher.utils.retry import RetryPolicy, dead_letters
+from Publisher.utils.scheduler import RequestScheduler
+
+
+def print_banner():
+    # Imported here so headless runs never pay for loading the figlet fonts
+    import pyfiglet
+
+    banner = pyfiglet.figlet_format("Canvas Late Penalty Tool", font="slant")
+    separator = "\u2500" * 100
+    print(separator)
+    print(banner)
+    print(separator)
+    print("\n")
+
+
+def get_user_input():
+    print("Please enter the following details:")
+    assignment_name = input("Assignment Name: ")
+    csv_file = input("Path to CSV File (default: 'grade.csv'): ") or "grade.csv"
+    return assignment_name, csv_file
+
+
+def display_intro():
+    print("Welcome to the Canvas Late Penalty Tool!")
+    print(
+        "This script will help you apply late penalties and update grades for a specific assignment in Canvas."
+    )
+    print("Project created by: Arthur Wei")
+    print("\n")
+
+
+def load_config(config_file="../config.json"):
+    try:
+        with open(config_file, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        print(f"Config file '{config_file}' not found, using command-line arguments.")
+    except json.JSONDecodeError:
+        print(
+            f"Error parsing the config file '{config_file}', using command-line arguments."
+        )
+    return {}
+
+
+def late_status(row):
+    if row.new_grade == 0:
+        return "missing"
+    return "late" if row.late else "none"
+
+
+def apply_penalty(course_id, assignment_id, row, policy, headers, endpoint):
+    submission_url = f"{endpoint}/courses/{course_id}/assignments/{assignment_id}/submissions/{row.student_id}"
+    payload = {
+        "submission": {
+            "posted_grade": row.new_grade,
+            "late_policy_status": late_status(row),
+        }
+    }
+    if row.late:
+        payload["submission"]["seconds_late_override"] = policy.seconds_late_override(row)
+
+    def send():
+        try:
+            response = send_request("PUT", submission_url, headers, json=payload)
+        except REQUEST_ERRORS as e:
+            print(f"Failed to update grade for student {row.name}: {e}")
+            return False
+        if response.status_code != 200:
+            print(
+                f"Failed to update grade for student {row.name}. Status code: {response.status_code}, Response: {response.text}"
+            )
+            return False
+        return True
+
+    if send():
+        return True
+    dead_letters.add(f"late penalty for student {row.name}", send)
+    return False
+
+
+def apply_plan(course_id, assignment, plan, policy, headers, endpoint, scheduler, bulk=False, batch_size=100):
+    # Write the plan back; --bulk sends it through update_grades in batches, which sets
+    # the grades but cannot mark submissions late
+    if bulk:
+        outcomes = bulk_update_grades(
+            course_id,
+            assignment.id,
+            {row.student_id: row.new_grade for row in plan},
+            headers,
+            endpoint,
+            batch_size,
+            scheduler,
+        )
+        return list(outcomes.values()).count("completed")
+    results = scheduler.map(
+        lambda row: apply_penalty(course_id, assignment.id, row, policy, headers, endpoint),
+        plan,
+    )
+    return results.count(True)
+
+
+def get_grades(
+    course_id,
+    headers,
+    endpoint,
+    assignment_name,
+    csv_file,
+    scheduler,
+    policy,
+    cache=None,
+    index=None,
+    bulk=False,
+    batch_size=100,
+    dry_run=False,
+    changed=None,
+):
+    with metrics.stage("roster_fetch"):
+        students, assignments = scheduler.map(
+            lambda fetch: fetch(course_id, headers, endpoint, cache),
+            [get_students, get_assignments],
+        )
+    assignment = find_assignment(assignments, assignment_name)
+    if not assignment:
+        print(f"Assignment '{assignment_name}' not found.")
+        print("Available assignments:", [assign.name for assign in assignments])
+        sys.exit(1)
+
+    # Get grades from CSV using zyphraser
+    with metrics.stage("csv_parse"):
+        table = zyphraser.get_score_table(csv_file, [assignment_name])
+
+    # Match CSV rows to Canvas students by school email, falling back to names
+    index = index or IdentityIndex()
+    index.refresh(students)
+    user_ids = index.match_rows(table)
+    index.save()
+    student_grades = grades_by_student(table, assignment_name, user_ids)
+    changed_ids = changed_students(table, assignment_name, user_ids, changed)
+    if changed_ids is not None:
+        # Only students whose row changed since the requested history snapshot
+        students = [student for student in students if student.id in changed_ids]
+        print(f"{len(students)} students changed since the requested snapshot.")
+
+    # One paginated request for every submission instead of one GET per student
+    with metrics.stage("submissions_fetch"):
+        submissions = get_submissions(course_id, assignment.id, headers, endpoint)
+
+    # Decide every penalty for the assignment at once, then only write back the grades that change
+    with metrics.stage("matching"):
+        plan = plan_penalties(policy, students, assignment, submissions, student_grades)
+    for row in plan:
+        label = f"LATE ({row.days_late:.1f} days)" if row.late else "On time"
+        print(
+            f"{label}: Student {row.name} - Current Grade: {row.current_grade}, CSV Grade: {row.csv_grade}, New Grade: {row.new_grade}"
+        )
+    if dry_run:
+        print(f"Dry run: {len(plan)} grade changes planned out of {len(students)} students.")
+        return plan
+
+    with metrics.stage("publishing"):
+        applied = apply_plan(course_id, assignment, plan, policy, headers, endpoint, scheduler, bulk, batch_size)
+    print(f"Applied {applied} grade changes out of {len(students)} students.")
+    return plan
+
+
+def main(argv=None):
+    # Set up argument parsing
+    parser = argparse.ArgumentParser(
+        description="Apply late penalties to the grades of a specific assignment in Canvas."
+    )
+    parser.add_argument("--access_token", help="The Canvas API access token")
+    parser.add_argument(
+        "--config", default="../config.json", help="Path to config.json"
+    )
+    parser.add_argument(
+        "--quiet", action="store_true", help="Skip the banner and introduction"
+    )
+    parser.add_argument("--course_id", help="The Canvas course ID")
+    parser.add_argument(
+        "--endpoint", help=f"The Canvas API base URL (default: {DEFAULT_ENDPOINT})"
+    )
+    parser.add_argument(
+        "--assignment_name", help="Name of the assignment to update grades for"
+    )
+    parser.add_argument(
+        "--csv_file",
+        default="grade.csv",
+        help="Path to the CSV file with student grades",
+    )
+    parser.add_argument(
+        "--policy",
+        choices=POLICIES,
+        default="flat",
+        help="flat: late increases lose --rate; per_day: they lose --rate per day late up to --cap; "
+        "canvas: post the full grade marked --late_days late for Canvas's late policy",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=0.2,
+        help="Share of a late increase taken off (per day for per_day)",
+    )
+    parser.add_argument(
+        "--cap", type=float, default=1.0, help="Largest share of an increase taken off"
+    )
+    parser.add_argument(
+        "--grace_hours",
+        type=float,
+        default=0.0,
+        help="Hours after the due date that still count as on time",
+    )
+    parser.add_argument(
+        "--late_days",
+        type=float,
+        default=4,
+        help="Days late reported to Canvas by the canvas policy",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.8,
+        help="The canvas policy only applies when CSV grade x threshold exceeds the current grade",
+    )
+    parser.add_argument(
+        "--dry_run",
+        action="store_true",
+        help="Print the penalty plan without changing any grade",
+    )
+    parser.add_argument(
+        "--bulk",
+        action="store_true",
+        help="Write the plan in batches through update_grades (grades only, submissions are not marked late)",
+    )
+    parser.add_argument(
+        "--batch_size", type=int, default=100, help="Number of grades per batch in bulk mode"
+    )
+    parser.add_argument(
+        "--history",
+        help="Store the CSV as a snapshot in this grade history database (default with --changed_since: grade_history.sqlite3)",
+    )
+    parser.add_argument(
+        "--changed_since",
+        help='Only consider students whose grade changed after this history snapshot id ("last": since the previous snapshot)',
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore the cached roster and assignment list and fetch them again",
+    )
+    parser.add_argument(
+        "--cache_ttl",
+        type=int,
+        help="Seconds before the cached roster and assignment list are revalidated",
+    )
+    parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Do not read or write the roster and assignment cache",
+    )
+    parser.add_argument(
+        "--report",
+        help="Write a run report with request latencies and stage timings (.json for JSON, otherwise Prometheus text)",
+    )
+    parser.add_argument(
+        "--max_retries",
+        type=int,
+        default=5,
+        help="Retries for throttled or failing Canvas requests",
+    )
+    parser.add_argument(
+        "--request_timeout",
+        type=float,
+        default=canvas_api.READ_TIMEOUT,
+        help="Seconds to wait for a Canvas response before retrying",
+    )
+    parser.add_argument(
+        "--max_concurrency",
+        type=int,
+        default=8,
+        help="Maximum number of Canvas requests in flight (1 = sequential)",
+    )
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument(
+        "--record",
+        help="Save every Canvas request and response, with timings, to this cassette file",
+    )
+    cassette.add_argument(
+        "--replay",
+        help="Answer Canvas requests from a recorded cassette instead of the network",
+    )
+    parser.add_argument(
+        "--replay_latency",
+        action="store_true",
+        help="Wait as long as each recorded request took when replaying",
+    )
+    parser.add_argument(
+        "--profile",
+        help="Profile the run with cProfile: PROFILE (pstats), PROFILE.txt (hot spots), PROFILE.folded (flame graph stacks)",
+    )
+
+    args = parser.parse_args(argv)
+
+    if not args.quiet:
+        print_banner()
+        display_intro()
+
+    # Load values from config.json
+    config = load_config(args.config)
+
+    # Use values from config.json if not provided in command-line arguments
+    access_token = args.access_token or config.get("access_token")
+    course_id = args.course_id or config.get("course_id")
+
+    if not access_token or not course_id:
+        print(
+            "Access token and course ID must be provided either via config.json or command-line arguments."
+        )
+        sys.exit(1)
+
+    if not args.assignment_name or not args.csv_file:
+        print(
+            "Command-line arguments not fully provided, switching to interactive mode."
+        )
+        assignment_name, csv_file = get_user_input()
+    else:
+        assignment_name = args.assignment_name
+        csv_file = args.csv_file
+
+    endpoint = args.endpoint or config.get("endpoint", DEFAULT_ENDPOINT)
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {access_token}",
+    }
+    policy = LatePolicy(
+        args.policy, args.rate, args.cap, args.grace_hours, args.late_days, args.threshold
+    )
+
+    canvas_api.retry_policy = RetryPolicy(args.max_retries)
+    canvas_api.client.resize(args.max_concurrency)
+    canvas_api.client.timeout = (canvas_api.CONNECT_TIMEOUT, args.request_timeout)
+    if args.replay:
+        # Every listing has to come from the cassette rather than a fresh cache entry
+        args.no_cache = True
+    scheduler = RequestScheduler(args.max_concurrency)
+    hooks = [scheduler.observe] + ([metrics.observe] if args.report else [])
+    canvas_api.response_hooks.extend(hooks)
+    with use_cassette(canvas_api.client, args.record, args.replay, args.replay_latency), profiled(args.profile):
+        try:
+            history_run = history_from_args(args, csv_file, course_id, [assignment_name], "late_penalty")
+            # Plan and apply the penalties
+            get_grades(
+                course_id,
+                headers,
+                endpoint,
+                assignment_name,
+                csv_file,
+                scheduler,
+                policy,
+                cache_from_args(args, config),
+                identity_from_args(args, config, course_id, endpoint),
+                args.bulk,
+                args.batch_size,
+                args.dry_run,
+                history_run.changed if history_run else None,
+            )
+            # Give every update that failed after its retries one more chance
+            dead_letters.redrive()
+            if history_run and not args.dry_run:
+                history_run.commit(len(dead_letters))
+        finally:
+            for hook in hooks:
+                canvas_api.response_hooks.remove(hook)
+    if args.record:
+        print(f"Recorded Canvas traffic saved to {args.record}")
+
+    if args.report:
+        metrics.write(args.report)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,34 @@
 import sys
 import argparse
-import pyfiglet
+import fnmatch
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 import json
-from Publisher.utils.canvas_api import get_students, get_assignments, find_assignment, update_grade
-from Publisher.utils.zyphraser import get_scores
+from Publisher.utils import canvas_api
+from Publisher.utils.canvas_api import DEFAULT_ENDPOINT, REQUEST_ERRORS, get_students, get_assignments, find_assignment, update_grade, bulk_update_grades, get_submissions
+from Publisher.utils.cache import cache_from_args
+from Publisher.utils.cassette import merge_cassettes, use_cassette
+from Publisher.utils.audit import write_audit
+from Publisher.utils.grade_diff import diff_grades
+from Publisher.utils.history import changed_students, history_from_args
+from Publisher.utils.identity import grades_by_student, identity_from_args
+from Publisher.utils.journal import DEFAULT_JOURNAL, PublishJournal
+from Publisher.utils.metrics import metrics
+from Publisher.utils.points import get_points_table, list_gradable
+from Publisher.utils.profiling import profiled
+from Publisher.utils.retry import RetryPolicy, dead_letters
+from Publisher.utils.scheduler import RequestScheduler
+from Publisher.utils.zyphraser import get_score_table, list_assignments
+
+# Number of assignments published side by side in batch mode
+BATCH_PIPELINE_DEPTH = 4
 
 def print_banner():
+    # Imported here so headless runs never pay for loading the figlet fonts
+    import pyfiglet
+
     banner = pyfiglet.figlet_format("Canvas Grade Publisher", font="slant")
     separator = u'\u2500' * 100
     print(separator)
@@ -37,74 +60,407 @@ def load_config(config_file='../config.json'):
         print(f"Error parsing the config file '{config_file}', using command-line arguments.")
     return {}
 
-def main():
-    print_banner()
-    display_intro()
+def match_grades(students, student_grades):
+    # Keep the CSV grades of students on the roster, reporting students without one
+    grades = {}
+    names = {}
+    missing = 0
+    for student in students:
+        grade = student_grades.get(student.id)
+        if grade is not None:
+            grades[student.id] = grade
+            names[student.id] = student.sortable_name
+        else:
+            missing += 1
+            print(f"No grade found for student {student.sortable_name}")
+    return grades, names, missing
 
-    # Load values from config.json
-    config = load_config()
+def publish_bulk(course_id, assignment, grades, names, headers, endpoint, batch_size, scheduler=None, journal=None, flagged=()):
+    print(f"Publishing {len(grades)} grades in batches of {batch_size}...")
+    outcomes = bulk_update_grades(course_id, assignment.id, grades, headers, endpoint, batch_size, scheduler, flagged)
+    failed = 0
+    for student_id, state in outcomes.items():
+        if state == 'completed':
+            if journal:
+                journal.record(course_id, assignment.id, student_id, grades[student_id])
+            print(f"Updated grade for student {names[student_id]} to {grades[student_id]}")
+        else:
+            failed += 1
+            print(f"Failed to update grade for student {names[student_id]} ({state})")
+            dead_letters.add(
+                f"grade {grades[student_id]} for student {names[student_id]}",
+                partial(send_grade, course_id, assignment, student_id, grades[student_id], names[student_id], headers, endpoint, journal),
+            )
+    print(f"Bulk publish finished: {len(outcomes) - failed} updated, {failed} failed.")
+    return len(outcomes) - failed, failed
+
+def send_grade(course_id, assignment, student_id, grade, name, headers, endpoint, journal=None):
+    try:
+        response = update_grade(course_id, assignment.id, student_id, grade, headers, endpoint)
+    except REQUEST_ERRORS as e:
+        print(f"Failed to update grade for student {name}: {e}")
+        return False
+    if response.status_code != 200:
+        return False
+    if journal:
+        journal.record(course_id, assignment.id, student_id, grade)
+    print(f"Updated grade for student {name} to {grade}")
+    return True
+
+def publish_each(course_id, assignment, grades, names, headers, endpoint, scheduler, journal=None):
+    def publish_student(student_id):
+        send = partial(send_grade, course_id, assignment, student_id, grades[student_id], names[student_id], headers, endpoint, journal)
+        if send():
+            return True
+        # Keep it for the re-drive at the end of the run
+        dead_letters.add(f"grade {grades[student_id]} for student {names[student_id]}", send)
+        return False
+
+    # Update the grade for each student
+    results = scheduler.map(publish_student, list(grades))
+    return results.count(True), results.count(False)
+
+def publish_assignment(course_id, assignment, students, student_grades, headers, endpoint, scheduler, args, journal=None, changed_ids=None):
+    # Publish one assignment and return (updated, failed, elapsed seconds)
+    start = time.perf_counter()
+    with metrics.stage("matching"):
+        grades, names, missing = match_grades(students, student_grades)
+
+    if changed_ids is not None:
+        # Only the students whose row changed since the requested history snapshot
+        grades = {student_id: grade for student_id, grade in grades.items() if student_id in changed_ids}
+        since = "the last published snapshot" if args.changed_since == "last" else f"snapshot {args.changed_since}"
+        print(f"{assignment.name}: {len(grades)} grades changed since {since}.")
+
+    flagged = set()
+    if args.diff_only or args.bulk:
+        # Prefetch the current grades in bulk. The batches cannot clear a "missing" flag,
+        # so the students Canvas marks missing are sent one by one.
+        with metrics.stage("diff"):
+            submissions = get_submissions(course_id, assignment.id, headers, endpoint)
+        flagged = {student_id for student_id, submission in submissions.items() if submission.late_policy_status == "missing"}
+    if args.diff_only:
+        # Drop every row Canvas already matches
+        with metrics.stage("diff"):
+            grades, unchanged = diff_grades(grades, submissions)
+        print(f"{assignment.name}: {len(grades)} changed, {len(unchanged)} unchanged, {missing} missing from the CSV.")
+
+    if args.resume and journal:
+        # Skip every grade the journal shows was already published with the same value
+        pending = journal.pending(course_id, assignment.id, grades)
+        print(f"{assignment.name}: resuming, {len(grades) - len(pending)} grades already published, {len(pending)} left.")
+        grades = pending
+
+    with metrics.stage("publishing"):
+        if args.bulk:
+            updated, failed = publish_bulk(
+                course_id, assignment, grades, names, headers, endpoint, args.batch_size, scheduler, journal, flagged
+            )
+        else:
+            updated, failed = publish_each(course_id, assignment, grades, names, headers, endpoint, scheduler, journal)
+    return updated, failed, time.perf_counter() - start
+
+def select_assignments(csv_file, args):
+    # Assignment names requested for a batch run, taken from the CSV's (points) columns
+    if args.assignments:
+        return args.assignments
+    available = list_gradable(csv_file) if args.percentages else list_assignments(csv_file)
+    if args.assignment_glob:
+        return [name for name in available if fnmatch.fnmatch(name, args.assignment_glob)]
+    return available
+
+def publish_batch(course_id, targets, students, table, user_ids, headers, endpoint, scheduler, args, journal=None, changed=None):
+    # Publish several assignments as one job. Assignments run side by side while every
+    # request still goes through the shared scheduler and its rate-limit budget.
+    def run(target):
+        csv_name, assignment = target
+        return publish_assignment(
+            course_id, assignment, students, grades_by_student(table, csv_name, user_ids), headers, endpoint, scheduler, args, journal,
+            changed_students(table, csv_name, user_ids, changed)
+        )
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(BATCH_PIPELINE_DEPTH, len(targets))) as pool:
+        results = list(pool.map(run, targets))
+    elapsed = time.perf_counter() - start
+
+    separator = u'\u2500' * 100
+    print(separator)
+    for (csv_name, assignment), (updated, failed, seconds) in zip(targets, results):
+        rate = updated / seconds if seconds else 0
+        print(f"{assignment.name}: {updated} updated, {failed} failed in {seconds:.1f}s ({rate:.1f} grades/s)")
+    total_updated = sum(result[0] for result in results)
+    total_failed = sum(result[1] for result in results)
+    rate = total_updated / elapsed if elapsed else 0
+    print(f"Published {len(targets)} assignments: {total_updated} updated, {total_failed} failed in {elapsed:.1f}s ({rate:.1f} grades/s)")
+    return [(assignment.name,) + result for (_, assignment), result in zip(targets, results)]
+
+def publish_single(course_id, assignment_name, assignment, students, table, user_ids, headers, endpoint, scheduler, args, journal=None, changed=None):
+    student_grades = grades_by_student(table, assignment_name, user_ids)
+    result = publish_assignment(
+        course_id, assignment, students, student_grades, headers, endpoint, scheduler, args, journal,
+        changed_students(table, assignment_name, user_ids, changed)
+    )
+    print(f"All students have been updated with their grades for assignment '{assignment_name}'.")
+    return [(assignment.name,) + result]
+
+def publish_course(course_id, csv_file, assignment_name, headers, endpoint, args, config, global_slots=None):
+    # Publish one course and return [(assignment name, updated, failed, seconds), ...]
+    cache = cache_from_args(args, config)
+    journal = PublishJournal(args.journal) if args.journal else None
+
+    # Share one scheduler so every request adapts to the same rate-limit budget
+    scheduler = RequestScheduler(args.max_concurrency, global_slots)
+    canvas_api.response_hooks.append(scheduler.observe)
+    if args.report:
+        canvas_api.response_hooks.append(metrics.observe)
+    try:
+        # Get the list of students and the list of assignments
+        with metrics.stage("roster_fetch"):
+            students, assignments = scheduler.map(
+                lambda fetch: fetch(course_id, headers, endpoint, cache), [get_students, get_assignments]
+            )
+        index = identity_from_args(args, config, course_id, endpoint)
+        index.refresh(students)
+        if args.canvas_export:
+            index.add_export(args.canvas_export)
+
+        if assignment_name is None:
+            # Resolve every assignment against the one catalog fetch
+            targets = []
+            for csv_name in select_assignments(csv_file, args):
+                assignment = find_assignment(assignments, csv_name)
+                if assignment:
+                    targets.append((csv_name, assignment))
+                else:
+                    print(f"Assignment '{csv_name}' not found, skipping.")
+            if not targets:
+                print("No assignments to publish.")
+                print("Available assignments:", [assign.name for assign in assignments])
+                sys.exit(1)
+        else:
+            assignment = find_assignment(assignments, assignment_name)
+            if not assignment:
+                print(f"Assignment '{assignment_name}' not found.")
+                print("Available assignments:", [assign.name for assign in assignments])
+                sys.exit(1)
+            targets = [(assignment_name, assignment)]
+
+        # Parse the export and match its rows once; every stage after this works on the
+        # same in-memory table
+        with metrics.stage("csv_parse"):
+            if args.percentages:
+                table = get_points_table(csv_file, targets, args.points_decimals, args.max_percent)
+                targets = [(csv_name, assignment) for csv_name, assignment in targets if csv_name in table.points]
+                if not targets:
+                    print("No assignments to publish.")
+                    sys.exit(1)
+            else:
+                table = get_score_table(csv_file, [csv_name for csv_name, _ in targets])
+        with metrics.stage("matching"):
+            user_ids = index.match_rows(table)
+            index.save()
+        if args.dump:
+            write_audit(args.dump, course_id, table, user_ids, students)
+        with metrics.stage("history"):
+            history_run = history_from_args(args, csv_file, course_id, [csv_name for csv_name, _ in targets])
+        changed = history_run.changed if history_run else None
+
+        if assignment_name is None:
+            results = publish_batch(course_id, targets, students, table, user_ids, headers, endpoint, scheduler, args, journal, changed)
+        else:
+            results = publish_single(
+                course_id, assignment_name, assignment, students, table, user_ids, headers, endpoint, scheduler, args, journal, changed
+            )
+
+        # Give every update that failed after its retries one more chance
+        dead_letters.redrive()
+        if history_run:
+            history_run.commit(len(dead_letters))
+        return results
+    finally:
+        canvas_api.response_hooks.remove(scheduler.observe)
+        if args.report:
+            canvas_api.response_hooks.remove(metrics.observe)
+
+# Shared across the worker processes of a multi-course run
+_global_slots = None
+
+def init_course_worker(global_slots, max_retries, max_concurrency, request_timeout):
+    # Runs once in every worker process. Spawned workers import canvas_api afresh, so
+    # the retry policy and pool size main set in the parent are applied again here.
+    global _global_slots
+    _global_slots = global_slots
+    canvas_api.retry_policy = RetryPolicy(max_retries)
+    canvas_api.client.resize(max_concurrency)
+    canvas_api.client.timeout = (canvas_api.CONNECT_TIMEOUT, request_timeout)
+
+def course_cassette(record, course_id):
+    # The part of a --record cassette written by the worker that publishes one course
+    return f"{record}.course_{course_id}"
+
+def publish_course_worker(course, assignment_name, headers, endpoint, args, config):
+    # Returns the course results and this course's metrics for the combined report. The
+    # cassette is set up here, in the worker's own client: a spawned worker never sees
+    # the session of the parent process.
+    metrics.reset()
+    record = course_cassette(args.record, course['course_id']) if args.record else None
+    try:
+        with use_cassette(canvas_api.client, record, args.replay, args.replay_latency):
+            results = publish_course(
+                course['course_id'], course['csv_file'], assignment_name, headers, endpoint, args, config, _global_slots
+            )
+    except SystemExit:
+        print(f"Publishing course {course['course_id']} stopped early.")
+        results = None
+    except Exception as e:
+        # One course failing must not take the other courses' report down with it
+        print(f"Publishing course {course['course_id']} failed: {e!r}")
+        results = None
+    return results, metrics.snapshot()
+
+def publish_courses(courses, assignment_name, headers, endpoint, args, config):
+    # Publish several course shells in parallel worker processes. One semaphore held by a
+    # manager process caps the requests in flight across all of them, since Canvas applies
+    # the rate limit to the access token rather than to each course.
+    start = time.perf_counter()
+    with multiprocessing.Manager() as manager:
+        global_slots = manager.BoundedSemaphore(args.max_concurrency)
+        workers = args.course_workers or len(courses)
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_course_worker,
+            initargs=(global_slots, args.max_retries, args.max_concurrency, args.request_timeout),
+        ) as pool:
+            futures = [
+                pool.submit(publish_course_worker, course, assignment_name, headers, endpoint, args, config)
+                for course in courses
+            ]
+            reports = []
+            for future in futures:
+                results, snapshot = future.result()
+                reports.append(results)
+                metrics.merge(snapshot)
+    elapsed = time.perf_counter() - start
+    if args.record:
+        merge_cassettes(args.record, [course_cassette(args.record, course['course_id']) for course in courses])
+
+    separator = u'\u2500' * 100
+    print(separator)
+    print("COMBINED REPORT")
+    total_updated = total_failed = 0
+    for course, report in zip(courses, reports):
+        if report is None:
+            print(f"Course {course['course_id']} ({course['csv_file']}): FAILED")
+            continue
+        for name, updated, failed, seconds in report:
+            total_updated += updated
+            total_failed += failed
+            print(f"Course {course['course_id']} - {name}: {updated} updated, {failed} failed in {seconds:.1f}s")
+    rate = total_updated / elapsed if elapsed else 0
+    print(f"Published {len(courses)} courses: {total_updated} updated, {total_failed} failed in {elapsed:.1f}s ({rate:.1f} grades/s)")
 
+def main(argv=None):
     # Set up argument parsing
     parser = argparse.ArgumentParser(description='Update grades for a specific assignment for all students in Canvas.')
     parser.add_argument('--access_token', help='The Canvas API access token')
+    parser.add_argument('--config', default='../config.json', help='Path to config.json')
+    parser.add_argument('--quiet', action='store_true', help='Skip the banner and introduction')
     parser.add_argument('--course_id', help='The Canvas course ID')
+    parser.add_argument('--endpoint', help=f'The Canvas API base URL (default: {DEFAULT_ENDPOINT})')
     parser.add_argument('--assignment_name', help='Name of the assignment to update grades for')
     parser.add_argument('--csv_file',default='grade.csv', help='Path to the CSV file with student grades')
+    parser.add_argument('--assignments', nargs='+', help='Publish several assignments in one run')
+    parser.add_argument('--assignment_glob', help='Publish every (points) column in the CSV matching this pattern, e.g. "ZyLab*"')
+    parser.add_argument('--all_assignments', action='store_true', help='Publish every (points) column in the CSV')
+    parser.add_argument('--bulk', action='store_true', help='Publish grades in batches through the update_grades endpoint')
+    parser.add_argument('--batch_size', type=int, default=100, help='Number of grades per batch in bulk mode')
+    parser.add_argument('--diff_only', action='store_true', help='Only publish grades that differ from the ones already in Canvas')
+    parser.add_argument('--refresh', action='store_true', help='Ignore the cached roster and assignment list and fetch them again')
+    parser.add_argument('--cache_ttl', type=int, help='Seconds before the cached roster and assignment list are revalidated')
+    parser.add_argument('--no_cache', action='store_true', help='Do not read or write the roster and assignment cache')
+    parser.add_argument('--max_concurrency', type=int, default=8, help='Maximum number of Canvas requests in flight (1 = sequential)')
+    parser.add_argument('--journal', default=DEFAULT_JOURNAL, help='Append-only log of published grades (empty string to disable)')
+    parser.add_argument('--resume', action='store_true', help='Skip grades the journal shows were already published')
+    parser.add_argument('--report', help='Write a run report with request latencies and stage timings (.json for JSON, otherwise Prometheus text)')
+    parser.add_argument('--max_retries', type=int, default=5, help='Retries for throttled or failing Canvas requests')
+    parser.add_argument('--request_timeout', type=float, default=canvas_api.READ_TIMEOUT, help='Seconds to wait for a Canvas response before retrying')
+    parser.add_argument('--percentages', action='store_true', help='Convert Zybooks percentage columns to points with each assignment\'s points_possible when there is no (points) column')
+    parser.add_argument('--points_decimals', type=int, default=2, help='Decimal places converted points are rounded to')
+    parser.add_argument('--max_percent', type=float, default=100.0, help='Cap percentages at this value before converting (e.g. 110 to keep extra credit)')
+    parser.add_argument('--history', help='Store the CSV as a snapshot in this grade history database (default with --changed_since: grade_history.sqlite3)')
+    parser.add_argument('--changed_since', help='Only publish grades that changed after this history snapshot id ("last": since the previous snapshot)')
+    parser.add_argument('--canvas_export', help='Canvas "Export Entire Gradebook" CSV used to match students by SIS Login ID')
+    parser.add_argument('--dump', help='Write the matched grades and unmatched CSV rows to this directory for auditing')
+    parser.add_argument('--course_workers', type=int, help='Number of worker processes when config.json lists several courses (default: one per course)')
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument('--record', help='Save every Canvas request and response, with timings, to this cassette file')
+    cassette.add_argument('--replay', help='Answer Canvas requests from a recorded cassette instead of the network')
+    parser.add_argument('--replay_latency', action='store_true', help='Wait as long as each recorded request took when replaying')
+    parser.add_argument('--profile', help='Profile the run with cProfile: PROFILE (pstats), PROFILE.txt (hot spots), PROFILE.folded (flame graph stacks)')
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+
+    if not args.quiet:
+        print_banner()
+        display_intro()
+
+    # Load values from config.json
+    config = load_config(args.config)
 
     # Use values from config.json if not provided in command-line arguments
     access_token = args.access_token or config.get('access_token')
     course_id = args.course_id or config.get('course_id')
 
-    if not access_token or not course_id:
+    # A "courses" list in config.json publishes several course shells, each with its own CSV
+    courses = None
+    if not args.course_id and config.get('courses'):
+        courses = [
+            {'course_id': course['course_id'], 'csv_file': course.get('csv_file', args.csv_file)}
+            for course in config['courses']
+        ]
+
+    if not access_token or not (course_id or courses):
         print("Access token and course ID must be provided either via config.json or command-line arguments.")
         sys.exit(1)
 
-    if not args.assignment_name or not args.csv_file:
+    batch = args.assignments or args.assignment_glob or args.all_assignments
+    if batch:
+        assignment_name, csv_file = None, args.csv_file
+    elif not args.assignment_name or not args.csv_file:
         print("Command-line arguments not fully provided, switching to interactive mode.")
         assignment_name, csv_file = get_user_input()
     else:
         assignment_name = args.assignment_name
         csv_file = args.csv_file
 
-    endpoint = 'https://canvas.ucsc.edu/api/v1'
+    endpoint = args.endpoint or config.get('endpoint', DEFAULT_ENDPOINT)
     headers = {
         'Content-Type': 'application/json',
         'Authorization': f'Bearer {access_token}'
     }
 
-    # Get the list of students
-    students = get_students(course_id, headers, endpoint)
-
-    # Get the list of assignments
-    assignments = get_assignments(course_id, headers, endpoint)
-    # Find the specified assignment
-    assignment = find_assignment(assignments, assignment_name)
-    if not assignment:
-        print(f"Assignment '{assignment_name}' not found.")
-        print("Available assignments:", [assign['name'] for assign in assignments])
-        sys.exit(1)
-
-    # Get grades from CSV using zyphraser
-    grades = get_scores(csv_file, assignment_name)
+    canvas_api.retry_policy = RetryPolicy(args.max_retries)
+    canvas_api.client.resize(args.max_concurrency)
+    canvas_api.client.timeout = (canvas_api.CONNECT_TIMEOUT, args.request_timeout)
+    if args.replay:
+        # Nothing reaches Canvas, so nothing may be journaled as published, and every
+        # listing has to come from the cassette rather than a fresh cache entry
+        args.journal = ''
+        args.no_cache = True
 
-    # Map student names to grades
-    student_grades = {(grade[1], grade[0]): grade[2] for grade in grades}
-
-    # Update the grade for each student
-    for student in students:
-        name_parts = student['sortable_name'].split(", ")
-        last_name = name_parts[0]
-        first_name = name_parts[1] if len(name_parts) > 1 else ''
-        grade = student_grades.get((first_name, last_name))
-        if grade is not None:
-            update_grade(course_id, assignment['id'], student['id'], grade, headers, endpoint)
-            print(f"Updated grade for student {student['sortable_name']} to {grade}")
+    with profiled(args.profile):
+        if courses:
+            # Every worker process records or replays its own courses
+            publish_courses(courses, assignment_name, headers, endpoint, args, config)
         else:
-            print(f"No grade found for student {student['sortable_name']}")
+            with use_cassette(canvas_api.client, args.record, args.replay, args.replay_latency):
+                publish_course(course_id, csv_file, assignment_name, headers, endpoint, args, config)
+    if args.record:
+        print(f"Recorded Canvas traffic saved to {args.record}")
 
-    print(f"All students have been updated with their grades for assignment '{assignment_name}'.")
+    if args.report:
+        metrics.write(args.report)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,29 @@
+# grading_tool/audit.py
+
+import csv
+import os
+
+
+def write_audit(directory, course_id, table, user_ids, students):
+    # Dump what the in-memory pipeline matched, in place of the CSV files the manual
+    # munge step used to leave behind
+    os.makedirs(directory, exist_ok=True)
+    logins = {student.id: student.login_id or '' for student in students}
+    names = {student.id: student.sortable_name for student in students}
+    assignments = list(table.points)
+
+    matched_file = os.path.join(directory, f"course_{course_id}_matched_grades.csv")
+    unmatched_file = os.path.join(directory, f"course_{course_id}_unmatched_rows.csv")
+    with open(matched_file, "w", newline="") as matched, open(unmatched_file, "w", newline="") as unmatched:
+        matched_writer = csv.writer(matched)
+        unmatched_writer = csv.writer(unmatched)
+        matched_writer.writerow(["Canvas ID", "SIS Login ID", "Student", "School email"] + assignments)
+        unmatched_writer.writerow(["Last name", "First name", "School email"] + assignments)
+        for index, user_id in enumerate(user_ids):
+            points = [table.points[assignment][index] for assignment in assignments]
+            if user_id is None:
+                unmatched_writer.writerow([table.last_names[index], table.first_names[index], table.emails[index]] + points)
+            else:
+                matched_writer.writerow([user_id, logins.get(user_id, ''), names.get(user_id, ''), table.emails[index]] + points)
+    print(f"Matched grades saved to {matched_file}")
+    print(f"Unmatched rows saved to {unmatched_file}")
@@ -0,0 +1,68 @@
+# grading_tool/cache.py
+
+import json
+import os
+import re
+import time
+from urllib.parse import urlparse
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "zycanvas")
+DEFAULT_TTL = 3600
+
+
+def host_key(endpoint):
+    # The endpoint's host as a file name part ("canvas.ucsc.edu", "127.0.0.1_8080"), so a
+    # course id that exists on two Canvas instances gets separate files
+    return re.sub(r"[^\w.-]", "_", urlparse(endpoint).netloc)
+
+
+class ListingCache:
+    # On-disk cache of paginated Canvas listings, one JSON file per host, course and listing.
+    # Within the TTL a listing is served without touching the network; after it, every
+    # page is revalidated with If-None-Match and only pages that changed are downloaded.
+    # Entries are also kept in memory so a long-lived process skips re-reading the files.
+    _memory = {}
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, ttl=DEFAULT_TTL, refresh=False):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.refresh = refresh
+
+    def _path(self, endpoint, course_id, name):
+        return os.path.join(self.cache_dir, f"{host_key(endpoint)}_course_{course_id}_{name}.json")
+
+    def load(self, endpoint, course_id, name):
+        if self.refresh:
+            return None
+        path = self._path(endpoint, course_id, name)
+        if path in self._memory:
+            return self._memory[path]
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        self._memory[path] = entry
+        return entry
+
+    def is_fresh(self, entry):
+        return entry is not None and time.time() - entry.get("fetched_at", 0) < self.ttl
+
+    def save(self, endpoint, course_id, name, pages):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(endpoint, course_id, name)
+        # Write to a temporary file first so an interrupted run never leaves half a cache
+        entry = {"fetched_at": time.time(), "pages": pages}
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+        self._memory[path] = entry
+
+
+def cache_from_args(args, config):
+    if args.no_cache:
+        return None
+    cache_dir = config.get("cache_dir", DEFAULT_CACHE_DIR)
+    ttl = args.cache_ttl if args.cache_ttl is not None else config.get("cache_ttl", DEFAULT_TTL)
+    return ListingCache(cache_dir, ttl, args.refresh)
@@ -1,46 +1,201 @@
 # grading_tool/canvas_api.py
 
+import re
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlencode, urlparse, urlunparse
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from Publisher.utils.records import Assignment, Student, Submission
+from Publisher.utils.retry import RetryPolicy
+
+DEFAULT_ENDPOINT = "https://canvas.ucsc.edu/api/v1"
+
+# Callables run on every Canvas response, e.g. RequestScheduler.observe
+response_hooks = []
+
+# Pages fetched at once when a listing's last page is known
+PAGE_PREFETCH = 4
+
+# Replaced by the scripts from their --max_retries option
+retry_policy = RetryPolicy()
+
+# Seconds to wait for a connection and for each read of the response. Without them a
+# stalled connection would hang the run instead of timing out and being retried.
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 60
+
+# Raised by send_request once the retries for a connection problem run out. Writers
+# catch them per request, so one unreachable update fails alone instead of the run.
+REQUEST_ERRORS = (requests.ConnectionError, requests.Timeout)
+
+class CanvasClient:
+    # Sends every Canvas request of the process through one keep-alive session, so the
+    # scripts, the REPL and the watch mode reuse pooled connections instead of paying a
+    # TCP and TLS handshake per request, and ask for gzip-compressed responses.
+    # Throttled (429/403) and 5xx responses and connection errors are retried with
+    # backoff. Hooks see every attempt, so the scheduler can back off as well.
+    def __init__(self, max_concurrency=8, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)):
+        self.session = requests.Session()
+        self.session.headers['Accept-Encoding'] = 'gzip'
+        self.timeout = timeout
+        self.pool_size = 0
+        self.resize(max_concurrency)
 
-def get_students(course_id, headers, endpoint):
-    students = []
+    def resize(self, max_concurrency):
+        # Room for max_concurrency requests plus the page prefetch of the roster and
+        # assignment listings, which are fetched side by side. The pool only grows, so
+        # a long-lived process keeps the connections it has.
+        pool_size = max_concurrency + 2 * PAGE_PREFETCH
+        if pool_size <= self.pool_size:
+            return
+        adapter = HTTPAdapter(pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.pool_size = pool_size
+
+    def request(self, method, url, headers, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, url, headers=headers, timeout=self.timeout, **kwargs)
+            except REQUEST_ERRORS as e:
+                if not retry_policy.should_retry(None, attempt):
+                    raise
+                print(f"{method} {url} failed ({e}), retrying...")
+                time.sleep(retry_policy.delay(None, attempt))
+                attempt += 1
+                continue
+            response.retries = attempt
+            for hook in response_hooks:
+                hook(response)
+            if not retry_policy.should_retry(response, attempt):
+                return response
+            time.sleep(retry_policy.delay(response, attempt))
+            attempt += 1
+
+    def close(self):
+        self.session.close()
+
+# Shared by every script; they resize it from their --max_concurrency option
+client = CanvasClient()
+
+def send_request(method, url, headers, **kwargs):
+    return client.request(method, url, headers, **kwargs)
+
+def parse_links(response):
+    # {'next': url, 'last': url, ...} from the Link header
+    links = {}
+    for link in response.headers.get('Link', '').split(','):
+        match = re.search(r'<([^>]*)>;\s*rel="(\w+)"', link)
+        if match:
+            links[match.group(2)] = match.group(1)
+    return links
+
+def page_urls(next_url, last_url):
+    # Every page URL from next to last, or None when Canvas paginates with opaque
+    # bookmark cursors and the pages can only be followed one at a time
+    if not next_url or not last_url:
+        return None
+    parsed = urlparse(next_url)
+    query = parse_qs(parsed.query, keep_blank_values=True)
+    first_page = query.get('page', [''])[0]
+    last_page = parse_qs(urlparse(last_url).query).get('page', [''])[0]
+    if not first_page.isdigit() or not last_page.isdigit():
+        return None
+    urls = []
+    for number in range(int(first_page), int(last_page) + 1):
+        query['page'] = [str(number)]
+        urls.append(urlunparse(parsed._replace(query=urlencode(query, doseq=True))))
+    return urls
+
+def fetch_page(url, headers, params, description, cached_pages):
+    page_url = requests.Request('GET', url, params=params).prepare().url
+    cached = cached_pages.get(page_url)
+    request_headers = headers
+    if cached and cached.get('etag'):
+        request_headers = dict(headers, **{'If-None-Match': cached['etag']})
+    response = send_request('GET', page_url, request_headers)
+    if response.status_code == 304:
+        # Page has not changed since it was cached
+        return cached
+    if response.status_code != 200:
+        print(f"Failed to retrieve {description}. Status code: {response.status_code}, Response: {response.text}")
+        sys.exit(1)
+    links = parse_links(response)
+    return {
+        'url': page_url,
+        'etag': response.headers.get('ETag'),
+        'items': response.json(),
+        'next': links.get('next'),
+        'last': links.get('last'),
+    }
+
+def paginate(url, headers, params, description, cached_pages=None):
+    # Yield every page of a listing in order. When the first page's Link header names
+    # the last page, the remaining pages are fetched concurrently; bookmark-style
+    # pagination falls back to following rel="next" one page at a time.
+    cached_pages = cached_pages or {}
+    page = fetch_page(url, headers, params, description, cached_pages)
+    yield page
+
+    urls = page_urls(page['next'], page.get('last'))
+    if urls:
+        with ThreadPoolExecutor(max_workers=min(PAGE_PREFETCH, len(urls))) as pool:
+            yield from pool.map(lambda page_url: fetch_page(page_url, headers, None, description, cached_pages), urls)
+        return
+    while page['next']:
+        # The next link already carries the query string
+        page = fetch_page(page['next'], headers, None, description, cached_pages)
+        yield page
+
+def get_paginated(url, headers, params, description, cache=None, cache_key=None, record=None):
+    # Every item of a listing; with a record class, items are trimmed to its fields
+    # before they are cached and returned as records
+    entry = cache.load(*cache_key) if cache else None
+    if cache and cache.is_fresh(entry):
+        items = [item for page in entry['pages'] for item in page['items']]
+        return [record(item) for item in items] if record else items
+    cached_pages = {page['url']: page for page in entry['pages']} if entry else {}
+
+    items = []
+    pages = []
+    for page in paginate(url, headers, params, description, cached_pages):
+        if record:
+            page['items'] = [record.trim(item) for item in page['items']]
+        items.extend(page['items'])
+        pages.append(page)
+
+    if cache:
+        cache.save(*cache_key, pages)
+    return [record(item) for item in items] if record else items
+
+def get_students(course_id, headers, endpoint, cache=None):
     users_url = f"{endpoint}/courses/{course_id}/users"
-    while users_url:
-        response = requests.get(users_url, headers=headers, params={"enrollment_type": "student", "per_page": 100})
-        if response.status_code != 200:
-            print(f"Failed to retrieve students. Status code: {response.status_code}, Response: {response.text}")
-            sys.exit(1)
-        students.extend(response.json())
-        users_url = None
-        if 'Link' in response.headers:
-            links = response.headers['Link'].split(',')
-            for link in links:
-                if 'rel="next"' in link:
-                    users_url = link[link.find('<') + 1:link.find('>')]
-    return students
-
-def get_assignments(course_id, headers, endpoint):
-    assignments = []
+    # include[]=email so Zybooks school emails can be matched to students directly
+    params = {"enrollment_type": "student", "include[]": "email", "per_page": 100}
+    return get_paginated(users_url, headers, params, "students", cache, (endpoint, course_id, "students"), Student)
+
+def get_assignments(course_id, headers, endpoint, cache=None):
     assignments_url = f"{endpoint}/courses/{course_id}/assignments"
-    while assignments_url:
-        response = requests.get(assignments_url, headers=headers, params={"per_page": 100})
-        if response.status_code != 200:
-            print(f"Failed to retrieve assignments. Status code: {response.status_code}, Response: {response.text}")
-            sys.exit(1)
-        assignments.extend(response.json())
-        assignments_url = None
-        if 'Link' in response.headers:
-            links = response.headers['Link'].split(',')
-            for link in links:
-                if 'rel="next"' in link:
-                    assignments_url = link[link.find('<') + 1:link.find('>')]
-    return assignments
+    return get_paginated(
+        assignments_url, headers, {"per_page": 100}, "assignments", cache, (endpoint, course_id, "assignments"), Assignment
+    )
+
+def get_submissions(course_id, assignment_id, headers, endpoint):
+    # Every student's submission for one assignment, keyed by Canvas user id
+    submissions_url = f"{endpoint}/courses/{course_id}/students/submissions"
+    params = {"student_ids[]": "all", "assignment_ids[]": assignment_id, "per_page": 100}
+    submissions = get_paginated(submissions_url, headers, params, "submissions", record=Submission)
+    return {submission.user_id: submission for submission in submissions}
 
 def find_assignment(assignments, assignment_name):
     normalized_assignment_name = assignment_name.replace(" ", "").lower()
     for assignment in assignments:
-        normalized_name = assignment['name'].replace(" ", "").lower()
+        normalized_name = assignment.name.replace(" ", "").lower()
         if normalized_name == normalized_assignment_name:
             return assignment
     return None
@@ -50,11 +205,81 @@ def update_grade(course_id, assignment_id, student_id, grade, headers, endpoint)
     payload = {
         "submission": {
             "posted_grade": grade,
-            "late_policy_status": ("missing" if grade in [0, "0"] else "none")
+            "late_policy_status": missing_status(grade)
         }
     }
-    response = requests.put(submission_url, headers=headers, json=payload)
+    response = send_request('PUT', submission_url, headers, json=payload)
     if "missing" in payload["submission"]["late_policy_status"]:
         print(f"marked as missing")
     if response.status_code != 200:
         print(f"Failed to update grade for student {student_id}. Status code: {response.status_code}, Response: {response.text}")
+    return response
+
+def missing_status(grade):
+    # Zero points however it is written (0, "0", "0.0", 0.0) marks the submission missing
+    try:
+        return "missing" if float(grade) == 0 else "none"
+    except (TypeError, ValueError):
+        return "none"
+
+def wait_for_progress(progress, headers, endpoint, poll_interval=1.0, timeout=600):
+    # Poll a Canvas Progress object until the background job completes or fails
+    progress_url = f"{endpoint}/progress/{progress['id']}"
+    deadline = time.monotonic() + timeout
+    while progress.get('workflow_state') in ('queued', 'running'):
+        if time.monotonic() > deadline:
+            print(f"Timed out waiting for progress {progress['id']} to finish.")
+            break
+        time.sleep(poll_interval)
+        response = send_request('GET', progress_url, headers)
+        if response.status_code != 200:
+            print(f"Failed to poll progress {progress['id']}. Status code: {response.status_code}, Response: {response.text}")
+            break
+        progress = response.json()
+    return progress
+
+def bulk_update_grades(course_id, assignment_id, grades, headers, endpoint, batch_size=100, scheduler=None, flagged=()):
+    # grades maps Canvas student ids to grades. Returns each student's outcome, which is
+    # the final workflow_state of the batch it was sent in ('completed' or 'failed')
+    update_url = f"{endpoint}/courses/{course_id}/assignments/{assignment_id}/submissions/update_grades"
+    # update_grades cannot set late_policy_status, so missing (zero) grades keep going
+    # through the single submission endpoint to be marked "missing", and so do the
+    # flagged students, whose submission Canvas marks missing now, to clear the flag
+    single = [(sid, grade) for sid, grade in grades.items() if missing_status(grade) == "missing" or sid in flagged]
+    graded = [(sid, grade) for sid, grade in grades.items() if missing_status(grade) != "missing" and sid not in flagged]
+    batches = [graded[start:start + batch_size] for start in range(0, len(graded), batch_size)]
+
+    def publish_batch(batch):
+        payload = {"grade_data": {str(sid): {"posted_grade": grade} for sid, grade in batch}}
+        try:
+            response = send_request('POST', update_url, headers, json=payload)
+            if response.status_code != 200:
+                print(f"Failed to submit grade batch. Status code: {response.status_code}, Response: {response.text}")
+                return 'failed'
+            progress = wait_for_progress(response.json(), headers, endpoint)
+        except REQUEST_ERRORS as e:
+            # Its students are re-driven one by one, which is safe even if the batch went through
+            print(f"Failed to submit grade batch: {e}")
+            return 'failed'
+        state = progress.get('workflow_state', 'failed')
+        if state != 'completed':
+            print(f"Grade batch finished as '{state}': {progress.get('message')}")
+        return state
+
+    def publish_single(item):
+        sid, grade = item
+        try:
+            response = update_grade(course_id, assignment_id, sid, grade, headers, endpoint)
+        except REQUEST_ERRORS as e:
+            print(f"Failed to update grade for student {sid}: {e}")
+            return 'failed'
+        return 'completed' if response.status_code == 200 else 'failed'
+
+    run = scheduler.map if scheduler else lambda fn, items: [fn(item) for item in items]
+    outcomes = {}
+    for batch, state in zip(batches, run(publish_batch, batches)):
+        for sid, _ in batch:
+            outcomes[sid] = state
+    for (sid, _), state in zip(single, run(publish_single, single)):
+        outcomes[sid] = state
+    return outcomes
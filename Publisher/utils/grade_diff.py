@@ -0,0 +1,25 @@
+# grading_tool/grade_diff.py
+
+from Publisher.utils.canvas_api import missing_status
+
+def grade_matches(grade, submission):
+    # True when Canvas already holds this grade with the late policy status we would set
+    if submission is None:
+        return False
+    if (submission.late_policy_status or 'none') != missing_status(grade):
+        return False
+    try:
+        return float(grade) == float(submission.score)
+    except (TypeError, ValueError):
+        return str(grade) == str(submission.grade)
+
+def diff_grades(grades, submissions):
+    # Split {student_id: grade} into the grades that differ from Canvas and the ones that don't
+    changed = {}
+    unchanged = []
+    for student_id, grade in grades.items():
+        if grade_matches(grade, submissions.get(student_id)):
+            unchanged.append(student_id)
+        else:
+            changed[student_id] = grade
+    return changed, unchanged
@@ -0,0 +1,337 @@
+# grading_tool/history.py
+
+import argparse
+import csv
+import os
+import re
+import sqlite3
+import time
+from pathlib import Path
+
+from Publisher.utils.identity import email_key, name_key
+from Publisher.utils.points import PERCENT_COLUMN
+from Publisher.utils.zyphraser import EMAIL_COLUMN, POINTS_SUFFIX
+
+DEFAULT_HISTORY = "grade_history.sqlite3"
+SOURCES = ["zybooks", "canvas"]
+
+# Seconds a run waits for another process (e.g. the other courses of a multi-course run)
+# to finish writing before giving up with "database is locked"
+LOCK_TIMEOUT = 60
+
+# Canvas gradebook export columns look like "ZyLab 1 (5000)" with the assignment id
+CANVAS_ASSIGNMENT_COLUMN = re.compile(r"^.+ \((\d+)\)$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    course_id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    file TEXT NOT NULL,
+    ingested_at REAL NOT NULL,
+    cells INTEGER NOT NULL,
+    changes INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS grades (
+    course_id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    student TEXT NOT NULL,
+    assignment TEXT NOT NULL,
+    value TEXT NOT NULL,
+    snapshot_id INTEGER NOT NULL,
+    PRIMARY KEY (course_id, source, student, assignment)
+);
+CREATE TABLE IF NOT EXISTS changes (
+    snapshot_id INTEGER NOT NULL,
+    course_id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    student TEXT NOT NULL,
+    assignment TEXT NOT NULL,
+    old_value TEXT,
+    new_value TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS changes_by_snapshot ON changes (course_id, source, snapshot_id);
+CREATE TABLE IF NOT EXISTS published (
+    course_id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    consumer TEXT NOT NULL,
+    assignment TEXT NOT NULL,
+    snapshot_id INTEGER NOT NULL,
+    PRIMARY KEY (course_id, source, consumer, assignment)
+);
+"""
+
+
+def assignment_key(column):
+    # "ZyLab1(points)" and "ZyLab 1 (10)" both belong to the assignment "zylab1"
+    if column.endswith(POINTS_SUFFIX):
+        column = column[:-len(POINTS_SUFFIX)]
+    else:
+        match = PERCENT_COLUMN.match(column)
+        if match:
+            column = match.group("name")
+    return column.replace(" ", "").lower()
+
+
+def zybooks_cells(file):
+    # (student, column, value) for every assignment cell of a Zybooks report. Students
+    # are keyed by school email, or by name when the report has no email.
+    with open(file, newline='') as csvfile:
+        reader = csv.DictReader(csvfile)
+        columns = [
+            col for col in reader.fieldnames
+            if col.endswith(POINTS_SUFFIX) or PERCENT_COLUMN.match(col)
+        ]
+        for row in reader:
+            student = email_key(row.get(EMAIL_COLUMN)) or name_key(row["First name"], row["Last name"])
+            for col in columns:
+                yield student, col, row[col] or ""
+
+
+def canvas_cells(file):
+    # (Canvas user id, column, value) for every assignment cell of a gradebook export
+    with open(file, newline='') as csvfile:
+        reader = csv.DictReader(csvfile)
+        columns = [col for col in reader.fieldnames if CANVAS_ASSIGNMENT_COLUMN.match(col)]
+        for row in reader:
+            student = (row.get("ID") or "").strip()
+            # Skips the "Points Possible" row
+            if not student:
+                continue
+            for col in columns:
+                yield student, col, row[col] or ""
+
+
+class GradeHistory:
+    # Every ingested Zybooks report and Canvas gradebook export, stored as the current
+    # value of each (student, assignment) cell plus a log of the cells that changed in
+    # each snapshot. Ingesting writes only the changed cells, and "what changed since
+    # snapshot X" is one lookup on the changes index. A scratch history works on an
+    # in-memory copy of the file and leaves the file untouched.
+    def __init__(self, path=DEFAULT_HISTORY, scratch=False):
+        self.path = path
+        if scratch:
+            self.db = sqlite3.connect(":memory:")
+            if os.path.exists(path):
+                source = sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True, timeout=LOCK_TIMEOUT)
+                try:
+                    source.backup(self.db)
+                finally:
+                    source.close()
+        else:
+            self.db = sqlite3.connect(path, timeout=LOCK_TIMEOUT)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def ingest(self, file, source="zybooks", course_id=""):
+        # Store a new snapshot of the file and return (snapshot id, cells, changed cells).
+        # The file is parsed before the write lock is taken, so other processes only wait
+        # for the diff and the inserts. The current values are read under the lock, so two
+        # runs ingesting the same course cannot both diff against the same state.
+        cells = list(zybooks_cells(file) if source == "zybooks" else canvas_cells(file))
+        course_id = str(course_id)
+        with self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            current = {
+                (student, assignment): value
+                for student, assignment, value in self.db.execute(
+                    "SELECT student, assignment, value FROM grades WHERE course_id = ? AND source = ?",
+                    (course_id, source),
+                )
+            }
+            cursor = self.db.execute(
+                "INSERT INTO snapshots (course_id, source, file, ingested_at, cells, changes) VALUES (?, ?, ?, ?, 0, 0)",
+                (course_id, source, file, time.time()),
+            )
+            snapshot_id = cursor.lastrowid
+            total = len(cells)
+            deltas = [
+                (snapshot_id, course_id, source, student, assignment, current.get((student, assignment)), value)
+                for student, assignment, value in cells
+                if current.get((student, assignment)) != value
+            ]
+            self.db.executemany(
+                "INSERT INTO changes (snapshot_id, course_id, source, student, assignment, old_value, new_value) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                deltas,
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO grades (course_id, source, student, assignment, value, snapshot_id) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(course_id, source, student, assignment, value, snapshot_id)
+                 for snapshot_id, course_id, source, student, assignment, _, value in deltas],
+            )
+            self.db.execute(
+                "UPDATE snapshots SET cells = ?, changes = ? WHERE id = ?", (total, len(deltas), snapshot_id)
+            )
+        return snapshot_id, total, len(deltas)
+
+    def previous_snapshot(self, snapshot_id, source="zybooks", course_id=""):
+        # The snapshot of the same course and source before this one, 0 when there is none
+        row = self.db.execute(
+            "SELECT MAX(id) FROM snapshots WHERE course_id = ? AND source = ? AND id < ?",
+            (str(course_id), source, snapshot_id),
+        ).fetchone()
+        return row[0] or 0
+
+    def changes_since(self, snapshot_id, source="zybooks", course_id=""):
+        # [(snapshot, student, assignment column, old value, new value), ...] after snapshot_id
+        return self.db.execute(
+            "SELECT snapshot_id, student, assignment, old_value, new_value FROM changes "
+            "WHERE course_id = ? AND source = ? AND snapshot_id > ? ORDER BY snapshot_id",
+            (str(course_id), source, snapshot_id),
+        ).fetchall()
+
+    def changed_cells(self, since, source="zybooks", course_id=""):
+        # Set of (student, assignment key) that changed after `since`: one snapshot id, or
+        # {assignment key: snapshot id} to use a different cutoff for every assignment
+        if not isinstance(since, dict):
+            return {
+                (student, assignment_key(assignment))
+                for _, student, assignment, _, _ in self.changes_since(since, source, course_id)
+            }
+        cells = set()
+        for snapshot_id, student, assignment, _, _ in self.changes_since(min(since.values(), default=0), source, course_id):
+            key = assignment_key(assignment)
+            if snapshot_id > since.get(key, 0):
+                cells.add((student, key))
+        return cells
+
+    def published_through(self, assignments, consumer, source="zybooks", course_id=""):
+        # {assignment key: last snapshot whose changes `consumer` published}, 0 when never
+        published = dict(self.db.execute(
+            "SELECT assignment, snapshot_id FROM published WHERE course_id = ? AND source = ? AND consumer = ?",
+            (str(course_id), source, consumer),
+        ).fetchall())
+        return {key: published.get(key, 0) for key in assignments}
+
+    def mark_published(self, assignments, snapshot_id, consumer, source="zybooks", course_id=""):
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO published (course_id, source, consumer, assignment, snapshot_id) VALUES (?, ?, ?, ?, ?)",
+                [(str(course_id), source, consumer, key, snapshot_id) for key in assignments],
+            )
+
+    def snapshots(self, course_id=None):
+        query = "SELECT id, course_id, source, file, ingested_at, cells, changes FROM snapshots"
+        if course_id is not None:
+            return self.db.execute(query + " WHERE course_id = ? ORDER BY id", (str(course_id),)).fetchall()
+        return self.db.execute(query + " ORDER BY id").fetchall()
+
+
+def changed_rows(table, csv_name, changed):
+    # Row mask of a ScoreTable: True where this assignment changed for the row's student
+    key = assignment_key(csv_name)
+    return [
+        (email_key(email) or name_key(first_name, last_name), key) in changed
+        for email, first_name, last_name in zip(table.emails, table.first_names, table.last_names)
+    ]
+
+
+def changed_students(table, csv_name, user_ids, changed):
+    # Canvas user ids whose grade for this assignment changed, None when not filtering
+    if changed is None:
+        return None
+    return {
+        user_id for user_id, keep in zip(user_ids, changed_rows(table, csv_name, changed))
+        if keep and user_id is not None
+    }
+
+
+class HistoryRun:
+    # The snapshot one run ingested and the cells it has to publish (None: everything).
+    # The run commits it once its grades are in Canvas, which moves the "published
+    # through" marker that --changed_since last diffs against. Without a path (a replay)
+    # nothing is marked.
+    def __init__(self, path, course_id, consumer, snapshot_id, assignments, changed):
+        self.path = path
+        self.course_id = course_id
+        self.consumer = consumer
+        self.snapshot_id = snapshot_id
+        self.assignments = assignments
+        self.changed = changed
+
+    def commit(self, failed=0):
+        # Mark the snapshot published, unless some updates still failed: their changes
+        # then stay in the next run's diff
+        if failed:
+            print(f"History: {failed} updates still failing, snapshot {self.snapshot_id} is not marked as published.")
+            return
+        if not self.path or not self.assignments:
+            return
+        history = GradeHistory(self.path)
+        try:
+            history.mark_published(self.assignments, self.snapshot_id, self.consumer, "zybooks", self.course_id)
+        finally:
+            history.close()
+
+
+def history_from_args(args, csv_file, course_id, assignments, consumer="publish"):
+    # Ingest the CSV as a new snapshot when --history or --changed_since is given and
+    # return a HistoryRun with the cells changed since the requested snapshot ("last":
+    # the last one `consumer` published for each assignment), or None without history
+    if not args.history and args.changed_since is None:
+        return None
+    path = args.history or DEFAULT_HISTORY
+    keys = sorted({assignment_key(name) for name in assignments})
+    # A replay diffs against a copy and neither stores its snapshot nor marks it published
+    replay = bool(getattr(args, "replay", None))
+    history = GradeHistory(path, scratch=replay)
+    if replay:
+        path = None
+    try:
+        snapshot_id, cells, changed = history.ingest(csv_file, "zybooks", course_id)
+        print(f"History snapshot {snapshot_id}: {changed} of {cells} cells changed.")
+        published = history.published_through(keys, consumer, "zybooks", course_id)
+        if args.changed_since is None:
+            # Everything is published, so every assignment is up to date afterwards
+            return HistoryRun(path, course_id, consumer, snapshot_id, keys, None)
+        if args.changed_since == "last":
+            since = published
+        else:
+            since = int(args.changed_since)
+        # Markers only move for assignments with no unpublished changes before `since`
+        covered = [key for key in keys if published[key] >= (since[key] if isinstance(since, dict) else since)]
+        return HistoryRun(
+            path, course_id, consumer, snapshot_id, covered, history.changed_cells(since, "zybooks", course_id)
+        )
+    finally:
+        history.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grade history of ingested Zybooks and Canvas exports")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="Path to the history database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser("ingest", help="Store a Zybooks report or Canvas gradebook export")
+    ingest.add_argument("file", help="Path to the CSV file")
+    ingest.add_argument("--source", choices=SOURCES, default="zybooks", help="Kind of export")
+    ingest.add_argument("--course_id", default="", help="Canvas course the export belongs to")
+    listing = commands.add_parser("snapshots", help="List the ingested snapshots")
+    listing.add_argument("--course_id", help="Only this course")
+    changes = commands.add_parser("changes", help="Cells that changed after a snapshot")
+    changes.add_argument("since", type=int, help="Snapshot id (0 for everything)")
+    changes.add_argument("--source", choices=SOURCES, default="zybooks", help="Kind of export")
+    changes.add_argument("--course_id", default="", help="Canvas course the export belongs to")
+    args = parser.parse_args(argv)
+
+    history = GradeHistory(args.history)
+    try:
+        if args.command == "ingest":
+            snapshot_id, cells, changed = history.ingest(args.file, args.source, args.course_id)
+            print(f"Snapshot {snapshot_id}: {changed} of {cells} cells changed.")
+        elif args.command == "snapshots":
+            for snapshot_id, course_id, source, file, ingested_at, cells, changed in history.snapshots(args.course_id):
+                when = time.strftime("%Y-%m-%d %H:%M", time.localtime(ingested_at))
+                print(f"{snapshot_id:>5}  {when}  course {course_id or '-'}  {source:<8}{changed:>7}/{cells:<7} {file}")
+        else:
+            for snapshot_id, student, assignment, old_value, new_value in history.changes_since(args.since, args.source, args.course_id):
+                print(f"{snapshot_id:>5}  {student}  {assignment}: {old_value if old_value is not None else '-'} -> {new_value}")
+    finally:
+        history.close()
+
+
+if __name__ == '__main__':
+    main()
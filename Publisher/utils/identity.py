@@ -0,0 +1,157 @@
+# grading_tool/identity.py
+
+import csv
+import json
+import os
+
+from Publisher.utils.cache import DEFAULT_CACHE_DIR, host_key
+
+
+def student_name(student):
+    # (first name, last name) from a Canvas "Last, First" sortable name; single-word
+    # names have no first name
+    name_parts = student.sortable_name.split(", ", 1)
+    last_name = name_parts[0]
+    first_name = name_parts[1] if len(name_parts) > 1 else ''
+    return first_name, last_name
+
+
+def name_key(first_name, last_name):
+    # Case, spacing and surrounding whitespace differences do not break a match
+    return " ".join(f"{last_name}|{first_name}".lower().split())
+
+
+def email_key(email):
+    return email.strip().lower() if isinstance(email, str) else ""
+
+
+class IdentityIndex:
+    # Maps Canvas user ids to SIS login ids, Zybooks school emails and names, so CSV rows
+    # are matched to students by email first and by name only as a fallback. The index is
+    # kept per host and course next to the listing cache: each run folds the current
+    # roster into it, and every Zybooks email that had to be matched by name is remembered
+    # as an alias so the next run finds that student directly. A read-only index loads
+    # the file but never writes it back.
+    def __init__(self, path=None, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self.students = {}
+        self.aliases = {}
+        self.dirty = False
+        if path:
+            self.load()
+        self._rebuild()
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        self.students = data.get("students", {})
+        self.aliases = data.get("aliases", {})
+
+    def save(self):
+        if not self.path or not self.dirty or self.read_only:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"students": self.students, "aliases": self.aliases}, f)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def _rebuild(self):
+        self.by_email = {}
+        self.by_name = {}
+        for user_id, entry in self.students.items():
+            for email in (entry["login_id"], entry["email"]):
+                if email:
+                    self.by_email[email] = user_id
+            key = name_key(entry["first_name"], entry["last_name"])
+            # Two students with the same name can only be told apart by email
+            self.by_name[key] = None if key in self.by_name else user_id
+        for email, user_id in self.aliases.items():
+            if user_id in self.students:
+                self.by_email.setdefault(email, user_id)
+
+    def refresh(self, students):
+        # Bring the index in line with the current roster and return how many entries changed
+        roster = {}
+        for student in students:
+            first_name, last_name = student_name(student)
+            roster[str(student.id)] = {
+                "login_id": email_key(student.login_id),
+                "email": email_key(student.email),
+                "first_name": first_name,
+                "last_name": last_name,
+            }
+        changed = sum(1 for user_id, entry in roster.items() if self.students.get(user_id) != entry)
+        changed += sum(1 for user_id in self.students if user_id not in roster)
+        if changed:
+            self.students = roster
+            self.aliases = {email: user_id for email, user_id in self.aliases.items() if user_id in roster}
+            self.dirty = True
+            self._rebuild()
+        return changed
+
+    def add_export(self, path):
+        # Learn login id -> user id pairs from a Canvas "Export Entire Gradebook" CSV. They
+        # cover tokens that are not allowed to see login ids in the roster listing.
+        added = 0
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                email = email_key(row.get('SIS Login ID'))
+                user_id = (row.get('ID') or '').strip()
+                # Skips the "Points Possible" row and students no longer on the roster
+                if email and user_id in self.students and self.by_email.get(email) != user_id:
+                    self.aliases[email] = user_id
+                    self.by_email[email] = user_id
+                    added += 1
+        if added:
+            self.dirty = True
+        return added
+
+    def resolve(self, email, first_name, last_name):
+        # Canvas user id for one CSV row, or None when it matches no student
+        email = email_key(email)
+        user_id = self.by_email.get(email) if email else None
+        if user_id is None:
+            user_id = self.by_name.get(name_key(first_name, last_name))
+            if user_id is not None and email:
+                self.aliases[email] = user_id
+                self.by_email[email] = user_id
+                self.dirty = True
+        return int(user_id) if user_id is not None else None
+
+    def match_rows(self, table):
+        # Canvas user id of every row of a ScoreTable, None for rows that match no student
+        user_ids = [
+            self.resolve(email, first_name, last_name)
+            for email, first_name, last_name in zip(table.emails, table.first_names, table.last_names)
+        ]
+        for user_id, first_name, last_name in zip(user_ids, table.first_names, table.last_names):
+            if user_id is None:
+                print(f"CSV row {last_name}, {first_name} does not match any Canvas student")
+        return user_ids
+
+
+def grades_by_student(table, assignment, user_ids):
+    # Map Canvas user ids to the points for one assignment of a ScoreTable
+    return {
+        user_id: points
+        for user_id, points in zip(user_ids, table.points[assignment])
+        if user_id is not None
+    }
+
+
+def identity_from_args(args, config, course_id, endpoint):
+    # Kept in the cache directory; --no_cache keeps the index in memory for this run only
+    # and --replay reads it without saving what the replayed run learns
+    cache_dir = config.get("cache_dir", DEFAULT_CACHE_DIR)
+    path = os.path.join(cache_dir, f"{host_key(endpoint)}_course_{course_id}_identity.json")
+    if getattr(args, "replay", None):
+        return IdentityIndex(path, read_only=True)
+    if args.no_cache:
+        return IdentityIndex()
+    return IdentityIndex(path)
@@ -0,0 +1,74 @@
+# grading_tool/journal.py
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+DEFAULT_JOURNAL = "publish_journal.jsonl"
+
+
+def grade_hash(grade):
+    return hashlib.sha256(str(grade).encode("utf-8")).hexdigest()[:16]
+
+
+class PublishJournal:
+    # Append-only JSONL log of every grade Canvas accepted. Each line is written and
+    # fsynced on its own, so a run that dies halfway leaves a complete record of what
+    # was already published.
+    def __init__(self, path=DEFAULT_JOURNAL):
+        self.path = path
+        self._lock = threading.Lock()
+        self._committed = None
+
+    def load(self):
+        # Set of (course_id, assignment_id, student_id, grade_hash) already published
+        if self._committed is None:
+            self._committed = set()
+            try:
+                with open(self.path, "r") as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except json.JSONDecodeError:
+                            # A torn last line from a crash mid-write
+                            continue
+                        self._committed.add(self._key(
+                            entry["course_id"], entry["assignment_id"], entry["student_id"], entry["grade_hash"]
+                        ))
+            except FileNotFoundError:
+                pass
+        return self._committed
+
+    @staticmethod
+    def _key(course_id, assignment_id, student_id, hashed):
+        return str(course_id), str(assignment_id), str(student_id), hashed
+
+    def is_committed(self, course_id, assignment_id, student_id, grade):
+        return self._key(course_id, assignment_id, student_id, grade_hash(grade)) in self.load()
+
+    def pending(self, course_id, assignment_id, grades):
+        # The part of {student_id: grade} that has not been published with this exact grade
+        return {
+            student_id: grade for student_id, grade in grades.items()
+            if not self.is_committed(course_id, assignment_id, student_id, grade)
+        }
+
+    def record(self, course_id, assignment_id, student_id, grade):
+        entry = {
+            "course_id": str(course_id),
+            "assignment_id": str(assignment_id),
+            "student_id": str(student_id),
+            "grade_hash": grade_hash(grade),
+            "time": time.time(),
+        }
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            # One write per line keeps appends from parallel course workers intact
+            with open(self.path, "a") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            if self._committed is not None:
+                self._committed.add(self._key(course_id, assignment_id, student_id, entry["grade_hash"]))
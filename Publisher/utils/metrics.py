@@ -0,0 +1,151 @@
+# grading_tool/metrics.py
+
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+
+def endpoint_template(url):
+    # /api/v1/courses/123/assignments/45/submissions/6 -> /api/v1/courses/:id/assignments/:id/submissions/:id
+    return re.sub(r"/\d+(?=/|$)", "/:id", urlparse(url).path)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class RunMetrics:
+    # Collects one sample per Canvas response plus wall time per pipeline stage
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.samples = []
+        self.stages = {}
+        self.started = time.time()
+
+    def observe(self, response):
+        request = response.request
+        cost = response.headers.get("X-Request-Cost")
+        sample = (
+            request.method if request is not None else "GET",
+            endpoint_template(response.url),
+            response.status_code,
+            response.elapsed.total_seconds(),
+            getattr(response, "retries", 0),
+            float(cost) if cost else 0.0,
+        )
+        with self._lock:
+            self.samples.append(sample)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                seconds, count = self.stages.get(name, (0.0, 0))
+                self.stages[name] = (seconds + elapsed, count + 1)
+
+    def snapshot(self):
+        # Plain data that can be sent back from a worker process and merged
+        with self._lock:
+            return list(self.samples), dict(self.stages)
+
+    def merge(self, snapshot):
+        samples, stages = snapshot
+        with self._lock:
+            self.samples.extend(samples)
+            for name, (seconds, count) in stages.items():
+                total, total_count = self.stages.get(name, (0.0, 0))
+                self.stages[name] = (total + seconds, total_count + count)
+
+    def report(self):
+        with self._lock:
+            samples = list(self.samples)
+            stages = dict(self.stages)
+
+        endpoints = {}
+        for method, endpoint, status, latency, retries, cost in samples:
+            endpoints.setdefault(f"{method} {endpoint}", []).append((status, latency, retries, cost))
+
+        report = {
+            "duration_seconds": round(time.time() - self.started, 3),
+            "requests": len(samples),
+            "stages": {name: {"seconds": round(seconds, 4), "count": count} for name, (seconds, count) in stages.items()},
+            "endpoints": {},
+        }
+        for name, rows in sorted(endpoints.items()):
+            latencies = [row[1] for row in rows]
+            statuses = {}
+            for row in rows:
+                statuses[str(row[0])] = statuses.get(str(row[0]), 0) + 1
+            report["endpoints"][name] = {
+                "count": len(rows),
+                "statuses": statuses,
+                "retries": sum(1 for row in rows if row[2]),
+                "rate_limit_cost": round(sum(row[3] for row in rows), 3),
+                "latency_seconds": {
+                    "p50": round(percentile(latencies, 0.50), 4),
+                    "p90": round(percentile(latencies, 0.90), 4),
+                    "p99": round(percentile(latencies, 0.99), 4),
+                    "max": round(max(latencies), 4),
+                    "sum": round(sum(latencies), 4),
+                },
+                "histogram": {
+                    str(bound): sum(1 for latency in latencies if latency <= bound) for bound in LATENCY_BUCKETS
+                },
+            }
+        return report
+
+    def prometheus(self):
+        report = self.report()
+        lines = [
+            "# TYPE zycanvas_stage_seconds gauge",
+        ]
+        for name, stage in report["stages"].items():
+            lines.append(f'zycanvas_stage_seconds{{stage="{name}"}} {stage["seconds"]}')
+        lines.append("# TYPE zycanvas_request_seconds histogram")
+        for name, endpoint in report["endpoints"].items():
+            method, path = name.split(" ", 1)
+            labels = f'method="{method}",endpoint="{path}"'
+            for bound, count in endpoint["histogram"].items():
+                lines.append(f'zycanvas_request_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'zycanvas_request_seconds_bucket{{{labels},le="+Inf"}} {endpoint["count"]}')
+            lines.append(f'zycanvas_request_seconds_sum{{{labels}}} {endpoint["latency_seconds"]["sum"]}')
+            lines.append(f'zycanvas_request_seconds_count{{{labels}}} {endpoint["count"]}')
+        lines.append("# TYPE zycanvas_request_retries_total counter")
+        for name, endpoint in report["endpoints"].items():
+            method, path = name.split(" ", 1)
+            lines.append(f'zycanvas_request_retries_total{{method="{method}",endpoint="{path}"}} {endpoint["retries"]}')
+        lines.append("# TYPE zycanvas_rate_limit_cost_total counter")
+        for name, endpoint in report["endpoints"].items():
+            method, path = name.split(" ", 1)
+            lines.append(f'zycanvas_rate_limit_cost_total{{method="{method}",endpoint="{path}"}} {endpoint["rate_limit_cost"]}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        # JSON for *.json, Prometheus text exposition format otherwise
+        with open(path, "w") as f:
+            if path.endswith(".json"):
+                json.dump(self.report(), f, indent=2)
+            else:
+                f.write(self.prometheus())
+        print(f"Run report saved to {path}")
+
+
+# Shared by every module of one run
+metrics = RunMetrics()
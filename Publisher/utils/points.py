@@ -0,0 +1,94 @@
+# grading_tool/points.py
+
+import csv
+import re
+import sys
+
+from Publisher.utils.zyphraser import EMAIL_COLUMN, POINTS_SUFFIX, ScoreTable, point_columns
+
+# Zybooks reports every assignment as "<name> (<zybooks total>)" holding a percentage
+PERCENT_COLUMN = re.compile(r"^(?P<name>.+?) \((?P<total>\d+(?:\.\d+)?)\)$")
+
+
+def percent_columns(header):
+    # Map assignment names to the percentage column that holds them
+    columns = {}
+    for col in header:
+        match = PERCENT_COLUMN.match(col)
+        if match:
+            columns[match.group("name")] = col
+    return columns
+
+
+def list_gradable(file):
+    # Assignment names that have a (points) column or a percentage column to convert
+    with open(file, newline='') as csvfile:
+        header = next(csv.reader(csvfile))
+    names = point_columns(header)
+    normalized = {name.replace(" ", "").lower() for name in names}
+    names += [name for name in percent_columns(header) if name.replace(" ", "").lower() not in normalized]
+    return names
+
+
+def find_percent_column(columns, csv_name):
+    # CSV names follow the README's convention of dropping spaces, so compare without them
+    normalized = csv_name.replace(" ", "").lower()
+    for name, col in columns.items():
+        if name.replace(" ", "").lower() == normalized:
+            return col
+    return None
+
+
+def get_points_table(file, targets, decimals=2, max_percent=100.0):
+    # ScoreTable for [(csv name, Canvas assignment), ...]. A (points) column in the CSV is
+    # used as is; otherwise the Zybooks percentage is scaled by the assignment's
+    # points_possible. All conversions are one vectorized pass over the frame. Assignments
+    # without points_possible are left out of the table.
+    import pandas as pd
+
+    try:
+        with open(file, newline='') as csvfile:
+            header = next(csv.reader(csvfile))
+        percents = percent_columns(header)
+
+        point_sources = {}
+        percent_sources = {}
+        for csv_name, assignment in targets:
+            points_col = f"{csv_name}{POINTS_SUFFIX}"
+            if points_col in header:
+                point_sources[csv_name] = points_col
+                continue
+            percent_col = find_percent_column(percents, csv_name)
+            if percent_col is None:
+                raise ValueError(f"Missing required column: {points_col} or a percentage column for {csv_name}")
+            if not assignment.points_possible:
+                # Scaling by nothing would publish zero points, and a missing flag, to everyone
+                print(f"Assignment '{assignment.name}' has no points possible in Canvas, skipping its percentages.")
+                continue
+            percent_sources[csv_name] = (percent_col, assignment.points_possible)
+
+        columns = ["Last name", "First name"] + ([EMAIL_COLUMN] if EMAIL_COLUMN in header else [])
+        usecols = set(columns) | set(point_sources.values()) | {col for col, _ in percent_sources.values()}
+        df = pd.read_csv(file, usecols=list(usecols), dtype=str, keep_default_na=False)
+
+        points = {csv_name: df[col].tolist() for csv_name, col in point_sources.items()}
+        if percent_sources:
+            names = list(percent_sources)
+            percent = df[[percent_sources[name][0] for name in names]].apply(pd.to_numeric, errors="coerce")
+            percent.columns = names
+            possible = pd.Series({name: percent_sources[name][1] for name in names}, dtype=float)
+            converted = (percent.clip(lower=0, upper=max_percent) / 100 * possible).round(decimals)
+            # Blank percentages stay blank, like an empty (points) cell
+            converted = converted.astype(object).where(converted.notna(), "")
+            for name in names:
+                points[name] = [value if value == "" else str(value) for value in converted[name]]
+
+        return ScoreTable(
+            df["Last name"].tolist(),
+            df["First name"].tolist(),
+            df[EMAIL_COLUMN].tolist() if EMAIL_COLUMN in header else [""] * len(df),
+            {csv_name: points[csv_name] for csv_name, _ in targets if csv_name in points},
+        )
+    except Exception as e:
+        print(f"Error reading the file: {e}")
+        sys.exit(1)
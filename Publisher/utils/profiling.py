@@ -0,0 +1,103 @@
+# grading_tool/profiling.py
+
+import os
+import sys
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Functions listed in each table of the hot-spot report
+HOT_SPOTS = 40
+
+# Stacks cheaper than this many microseconds are left out of the flame graph
+MIN_STACK_MICROSECONDS = 1
+
+
+def frame_label(func):
+    filename, lineno, name = func
+    if filename == "~":
+        # Built-ins have no source file
+        return name.replace(";", ",")
+    return f"{name} ({os.path.basename(filename)}:{lineno})".replace(";", ",")
+
+
+def folded_stacks(stats):
+    # Collapsed stacks ("root;caller;callee microseconds") for flamegraph.pl or speedscope.
+    # cProfile only records caller -> callee edges, so a function's time is split over
+    # the stacks that reach it in proportion to the time spent through each edge.
+    children = defaultdict(dict)
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            children[caller][func] = edge[3]
+    stacks = defaultdict(int)
+
+    def walk(func, path, share):
+        microseconds = int(stats[func][2] * share * 1e6)
+        if microseconds >= MIN_STACK_MICROSECONDS:
+            stacks[";".join(frame_label(frame) for frame in path)] += microseconds
+        for child, edge_time in children[func].items():
+            # Recursion would repeat the same time forever
+            if child in path or not stats[child][3]:
+                continue
+            child_share = share * edge_time / stats[child][3]
+            if stats[child][3] * child_share * 1e6 >= MIN_STACK_MICROSECONDS:
+                walk(child, path + [child], child_share)
+
+    for func, (_, _, _, _, callers) in stats.items():
+        if not callers:
+            walk(func, [func], 1.0)
+    return stacks
+
+
+def write_profile(path, profiles):
+    import pstats
+
+    stats = pstats.Stats(profiles[0])
+    for profile in profiles[1:]:
+        stats.add(profile)
+    stats.dump_stats(path)
+
+    with open(f"{path}.txt", "w") as f:
+        stats.stream = f
+        stats.sort_stats("cumulative").print_stats(HOT_SPOTS)
+        stats.sort_stats("tottime").print_stats(HOT_SPOTS)
+
+    with open(f"{path}.folded", "w") as f:
+        for stack, microseconds in sorted(folded_stacks(stats.stats).items()):
+            f.write(f"{stack} {microseconds}\n")
+    print(f"Profile saved to {path} (hot spots in {path}.txt, flame graph stacks in {path}.folded)")
+
+
+@contextmanager
+def profiled(path):
+    # Run the block under cProfile and write, for PATH:
+    #   PATH         the pstats dump (python -m pstats, snakeviz)
+    #   PATH.txt     the hot spots, by cumulative and by own time
+    #   PATH.folded  collapsed stacks for flamegraph.pl or speedscope
+    # Requests run on worker threads, so threads started inside the block are profiled
+    # as well and merged into the same report.
+    if not path:
+        yield
+        return
+    import cProfile
+    import threading
+
+    profiles = [cProfile.Profile()]
+
+    def profile_thread(frame, event, arg):
+        # Runs on the first event of every new thread and hands over to cProfile
+        profile = cProfile.Profile()
+        profiles.append(profile)
+        profile.enable()
+
+    # From Python 3.12 one profiler already sees every thread
+    per_thread = sys.version_info < (3, 12)
+    if per_thread:
+        threading.setprofile(profile_thread)
+    profiles[0].enable()
+    try:
+        yield
+    finally:
+        profiles[0].disable()
+        if per_thread:
+            threading.setprofile(None)
+        write_profile(path, profiles)
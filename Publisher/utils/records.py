@@ -0,0 +1,33 @@
+# grading_tool/records.py
+
+
+class Record:
+    # A Canvas JSON object reduced to the fields the tools read. Fields live in
+    # __slots__ instead of a per-object dict, so a large roster or submission listing
+    # keeps a few attributes per entry rather than the full API payload.
+    __slots__ = ()
+
+    def __init__(self, item):
+        for field in self.__slots__:
+            setattr(self, field, item.get(field))
+
+    @classmethod
+    def trim(cls, item):
+        # The JSON item without the fields no record reads, as stored in the listing cache
+        return {field: item[field] for field in cls.__slots__ if field in item}
+
+    def __repr__(self):
+        fields = ", ".join(f"{field}={getattr(self, field)!r}" for field in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class Student(Record):
+    __slots__ = ("id", "sortable_name", "login_id", "email")
+
+
+class Assignment(Record):
+    __slots__ = ("id", "name", "points_possible", "due_at")
+
+
+class Submission(Record):
+    __slots__ = ("user_id", "grade", "score", "late_policy_status", "submitted_at", "cached_due_date")
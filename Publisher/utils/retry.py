@@ -0,0 +1,76 @@
+# grading_tool/retry.py
+
+import random
+import threading
+
+# Statuses worth another attempt: throttling and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def is_throttled(response):
+    # Canvas answers 403 "Rate Limit Exceeded" when the token's bucket is empty
+    return response.status_code == 429 or (
+        response.status_code == 403 and "Rate Limit Exceeded" in response.text
+    )
+
+
+class RetryPolicy:
+    # Jittered exponential backoff that honors Retry-After
+    def __init__(self, max_retries=5, base_delay=0.5, max_delay=30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, response, attempt):
+        if attempt >= self.max_retries:
+            return False
+        return response is None or response.status_code in RETRY_STATUSES or is_throttled(response)
+
+    def delay(self, response, attempt):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(self.max_delay, float(retry_after))
+            except ValueError:
+                pass
+        # Full jitter: anywhere between 0 and the exponential ceiling
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class DeadLetterQueue:
+    # Updates that still failed after every retry, kept so they can be re-driven at the
+    # end of the run. Each entry is a description and a callable that returns True on success.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.entries = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        # Forget the failures of a previous run in the same process
+        with self._lock:
+            self.entries = []
+
+    def add(self, description, retry):
+        with self._lock:
+            self.entries.append((description, retry))
+
+    def redrive(self):
+        # Try every entry once more; the ones that fail again stay in the queue
+        with self._lock:
+            entries, self.entries = self.entries, []
+        if not entries:
+            return 0
+        print(f"Re-driving {len(entries)} failed updates...")
+        for description, retry in entries:
+            if not retry():
+                self.add(description, retry)
+        for description, _ in self.entries:
+            print(f"Still failing after re-drive: {description}")
+        print(f"Re-drive finished: {len(entries) - len(self.entries)} recovered, {len(self.entries)} still failing.")
+        return len(self.entries)
+
+
+# Shared by every module of one run
+dead_letters = DeadLetterQueue()
@@ -3,26 +3,69 @@
 import argparse
 import sys
 import csv
+from collections import namedtuple
+
+POINTS_SUFFIX = "(points)"
+EMAIL_COLUMN = "School email"
+
+# Columnar scores for many assignments: points maps each assignment to a list
+# aligned with last_names, first_names and emails
+ScoreTable = namedtuple("ScoreTable", ["last_names", "first_names", "emails", "points"])
+
+def point_columns(header):
+    # Assignment names of every "<assignment>(points)" column
+    return [col[:-len(POINTS_SUFFIX)] for col in header if col.endswith(POINTS_SUFFIX)]
+
+def list_assignments(file):
+    # Assignment names of every (points) column in the CSV header
+    with open(file, newline='') as csvfile:
+        return point_columns(next(csv.reader(csvfile)))
+
+def iter_scores(file, assignments=None):
+    # Stream (last name, first name, school email, (points, ...)) records from the CSV,
+    # resolving the column positions once. With no assignments every (points) column is
+    # read. The email is empty when the export has no "School email" column.
+    with open(file, newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        header = next(reader)
+        if assignments is None:
+            assignments = point_columns(header)
+
+        required_columns = ["Last name", "First name"] + [f"{assignment}{POINTS_SUFFIX}" for assignment in assignments]
+        for col in required_columns:
+            if col not in header:
+                raise ValueError(f"Missing required column: {col}")
+
+        last_index, first_index, *point_indexes = [header.index(col) for col in required_columns]
+        email_index = header.index(EMAIL_COLUMN) if EMAIL_COLUMN in header else None
+        for row in reader:
+            email = row[email_index] if email_index is not None else ""
+            yield row[last_index], row[first_index], email, tuple(row[index] for index in point_indexes)
+
+def get_score_table(file, assignments=None):
+    try:
+        if assignments is None:
+            assignments = list_assignments(file)
+        table = ScoreTable([], [], [], {assignment: [] for assignment in assignments})
+        columns = [table.points[assignment] for assignment in assignments]
+        for last_name, first_name, email, points in iter_scores(file, assignments):
+            table.last_names.append(last_name)
+            table.first_names.append(first_name)
+            table.emails.append(email)
+            for column, value in zip(columns, points):
+                column.append(value)
+        return table
+    except Exception as e:
+        print(f"Error reading the file: {e}")
+        sys.exit(1)
+
+def grades_by_name(table, assignment):
+    # Map (first name, last name) to the points for one assignment of a ScoreTable
+    return dict(zip(zip(table.first_names, table.last_names), table.points[assignment]))
 
 def get_scores(file, assignment):
     try:
-        with open(file, newline='') as csvfile:
-            reader = csv.reader(csvfile)
-            header = next(reader)
-
-            required_columns = ["Last name", "First name", f"{assignment}(points)"]
-            for col in required_columns:
-                if col not in header:
-                    raise ValueError(f"Missing required column: {col}")
-
-            data = []
-            for row in reader:
-                last_name = row[header.index("Last name")]
-                first_name = row[header.index("First name")]
-                points = row[header.index(f"{assignment}(points)")]
-                data.append((last_name, first_name, points))
-
-            return data
+        return [(last_name, first_name, points[0]) for last_name, first_name, _, points in iter_scores(file, [assignment])]
     except Exception as e:
         print(f"Error reading the file: {e}")
         sys.exit(1)
@@ -30,13 +73,15 @@ def get_scores(file, assignment):
 def main():
     parser = argparse.ArgumentParser(description="Get grades from zybooks")
     parser.add_argument("file", help="Path to the CSV file")
-    parser.add_argument("--assignment", default="ZyLab2", help="Assignment name to get scores for")
+    parser.add_argument("--assignment", nargs="+", default=["ZyLab2"], help="Assignment names to get scores for")
+    parser.add_argument("--all", action="store_true", help="Get scores for every (points) column")
     args = parser.parse_args()
 
-    scores = get_scores(args.file, args.assignment)
+    table = get_score_table(args.file, None if args.all else args.assignment)
 
-    for score in scores:
-        print(f"Last name: {score[0]}, First name: {score[1]}, {args.assignment}: {score[2]}")
+    for index, (last_name, first_name) in enumerate(zip(table.last_names, table.first_names)):
+        scores = ", ".join(f"{assignment}: {points[index]}" for assignment, points in table.points.items())
+        print(f"Last name: {last_name}, First name: {first_name}, {scores}")
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,230 @@
+# bench/fake_canvas.py
+#
+# A local stand-in for the parts of the Canvas API that Publisher uses, for
+# benchmarking without touching canvas.ucsc.edu. Point the tools at it with
+# --endpoint http://127.0.0.1:<port>/api/v1
+
+import argparse
+import gzip
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+# Canvas gives every access token a leaky bucket of 700 units
+RATE_LIMIT_BUCKET = 700.0
+
+
+class FakeCanvas:
+    # In-memory course data plus the simulated latency and rate limit
+    def __init__(self, students, assignments, latency=0.0, request_cost=1.0, refill_rate=400.0):
+        self.students = students
+        self.assignments = assignments
+        self.latency = latency
+        self.request_cost = request_cost
+        self.refill_rate = refill_rate
+        self.submissions = {}
+        self.progress = {}
+        self.request_count = 0
+        self._remaining = RATE_LIMIT_BUCKET
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def charge(self):
+        # Take one request's cost out of the bucket; False when the token is throttled
+        with self._lock:
+            now = time.monotonic()
+            self._remaining = min(RATE_LIMIT_BUCKET, self._remaining + (now - self._last_refill) * self.refill_rate)
+            self._last_refill = now
+            self.request_count += 1
+            if self._remaining < self.request_cost:
+                return False, self._remaining
+            self._remaining -= self.request_cost
+            return True, self._remaining
+
+    def submission(self, assignment_id, student_id):
+        key = (assignment_id, student_id)
+        with self._lock:
+            if key not in self.submissions:
+                self.submissions[key] = {
+                    "assignment_id": assignment_id,
+                    "user_id": student_id,
+                    "grade": None,
+                    "score": None,
+                    "submitted_at": None,
+                    "late_policy_status": None,
+                    "workflow_state": "unsubmitted",
+                }
+            return self.submissions[key]
+
+    def grade(self, assignment_id, student_id, posted_grade, late_policy_status=None):
+        submission = self.submission(assignment_id, student_id)
+        with self._lock:
+            submission["grade"] = None if posted_grade is None else str(posted_grade)
+            try:
+                submission["score"] = float(posted_grade)
+            except (TypeError, ValueError):
+                submission["score"] = None
+            if late_policy_status is not None:
+                submission["late_policy_status"] = None if late_policy_status == "none" else late_policy_status
+            submission["workflow_state"] = "graded"
+            return dict(submission)
+
+
+def make_handler(canvas):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in separate writes; with Nagle on, the body waits for
+        # the client's delayed ACK and every keep-alive request stalls ~40 ms
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body, extra_headers=None, remaining=None):
+            payload = json.dumps(body).encode("utf-8")
+            # Canvas compresses responses for clients that accept gzip
+            compress = "gzip" in self.headers.get("Accept-Encoding", "")
+            if compress:
+                payload = gzip.compress(payload)
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            if compress:
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(payload)))
+            self.send_header("X-Request-Cost", str(canvas.request_cost))
+            if remaining is not None:
+                self.send_header("X-Rate-Limit-Remaining", f"{remaining:.1f}")
+            for name, value in (extra_headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def _paginate(self, url, query, items, remaining):
+            per_page = int(query.get("per_page", ["10"])[0])
+            page = int(query.get("page", ["1"])[0])
+            last = max(1, -(-len(items) // per_page))
+            base = f"http://{self.headers['Host']}{url.path}"
+
+            def link(number):
+                params = {key: values for key, values in query.items() if key != "page"}
+                params["page"] = [str(number)]
+                return f"{base}?{urlencode(params, doseq=True)}"
+
+            links = [f'<{link(1)}>; rel="first"', f'<{link(last)}>; rel="last"']
+            if page < last:
+                links.insert(0, f'<{link(page + 1)}>; rel="next"')
+            body = items[(page - 1) * per_page:page * per_page]
+            etag = '"' + hashlib.md5(json.dumps(body).encode("utf-8")).hexdigest() + '"'
+            headers = {"Link": ",".join(links), "ETag": etag}
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.send_header("X-Rate-Limit-Remaining", f"{remaining:.1f}")
+                self.end_headers()
+                return
+            self._send(200, body, headers, remaining)
+
+        def _handle(self, method):
+            allowed, remaining = canvas.charge()
+            if canvas.latency:
+                time.sleep(canvas.latency)
+            if not allowed:
+                self._send(403, {"errors": "403 Forbidden (Rate Limit Exceeded)"}, remaining=remaining)
+                return
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            path = url.path.rstrip("/")
+
+            if method == "GET" and re.fullmatch(r"/api/v1/courses/\w+/users", path):
+                return self._paginate(url, query, canvas.students, remaining)
+            if method == "GET" and re.fullmatch(r"/api/v1/courses/\w+/assignments", path):
+                return self._paginate(url, query, canvas.assignments, remaining)
+            if method == "GET" and re.fullmatch(r"/api/v1/courses/\w+/students/submissions", path):
+                assignment_id = int(query["assignment_ids[]"][0])
+                submissions = [canvas.submission(assignment_id, student["id"]) for student in canvas.students]
+                return self._paginate(url, query, submissions, remaining)
+
+            match = re.fullmatch(r"/api/v1/courses/\w+/assignments/(\d+)/submissions/update_grades", path)
+            if method == "POST" and match:
+                assignment_id = int(match.group(1))
+                for student_id, data in self._body().get("grade_data", {}).items():
+                    canvas.grade(assignment_id, int(student_id), data.get("posted_grade"))
+                with canvas._lock:
+                    progress = {"id": len(canvas.progress) + 1, "workflow_state": "completed", "completion": 100}
+                    canvas.progress[progress["id"]] = progress
+                return self._send(200, dict(progress, workflow_state="queued"), remaining=remaining)
+
+            match = re.fullmatch(r"/api/v1/courses/\w+/assignments/(\d+)/submissions/(\d+)", path)
+            if match:
+                assignment_id, student_id = int(match.group(1)), int(match.group(2))
+                if method == "GET":
+                    return self._send(200, canvas.submission(assignment_id, student_id), remaining=remaining)
+                if method == "PUT":
+                    data = self._body().get("submission", {})
+                    submission = canvas.grade(
+                        assignment_id, student_id, data.get("posted_grade"), data.get("late_policy_status")
+                    )
+                    return self._send(200, submission, remaining=remaining)
+
+            match = re.fullmatch(r"/api/v1/progress/(\d+)", path)
+            if method == "GET" and match and int(match.group(1)) in canvas.progress:
+                return self._send(200, canvas.progress[int(match.group(1))], remaining=remaining)
+
+            self._send(404, {"errors": [{"message": "The specified resource does not exist."}]}, remaining=remaining)
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_PUT(self):
+            self._handle("PUT")
+
+        def do_POST(self):
+            self._handle("POST")
+
+    return Handler
+
+
+def start_server(canvas, host="127.0.0.1", port=0):
+    # Serve canvas on a background thread; returns the server and its API base URL
+    server = ThreadingHTTPServer((host, port), make_handler(canvas))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}/api/v1"
+
+
+def main():
+    from bench.synthetic import make_assignments, make_students
+
+    parser = argparse.ArgumentParser(description="Run a local fake Canvas API server")
+    parser.add_argument("--students", type=int, default=100, help="Number of students in the roster")
+    parser.add_argument("--assignments", type=int, default=10, help="Number of assignments")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of simulated latency per request")
+    parser.add_argument("--request_cost", type=float, default=1.0, help="Rate-limit units charged per request")
+    parser.add_argument("--refill_rate", type=float, default=400.0, help="Rate-limit units restored per second")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    args = parser.parse_args()
+
+    canvas = FakeCanvas(
+        make_students(args.students), make_assignments(args.assignments), args.latency, args.request_cost, args.refill_rate
+    )
+    server, endpoint = start_server(canvas, port=args.port)
+    print(f"Fake Canvas listening at {endpoint} (course id: any)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
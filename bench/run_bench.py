@@ -0,0 +1,181 @@
+# bench/run_bench.py
+#
+# End-to-end throughput benchmark against the local fake Canvas server.
+# Run from the project root:
+#
+#   python -m bench.run_bench --sizes 100 1000 10000
+#
+# Every pipeline stage reports wall time, Canvas requests per second and the
+# peak Python heap allocated while it ran (tracemalloc).
+
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from argparse import Namespace
+
+from bench.fake_canvas import FakeCanvas, start_server
+from bench.synthetic import (
+    csv_assignment_name,
+    make_assignments,
+    make_students,
+    write_canvas_csv,
+    write_zybooks_csv,
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COURSE_ID = "1"
+
+
+def load_grade_munge():
+    # gradeMunge.v3.py is not an importable module name, so load it from its path
+    path = os.path.join(ROOT, "NameFix", "gradeMunge.v3.py")
+    spec = importlib.util.spec_from_file_location("grade_munge", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def measure(name, canvas, fn):
+    # Run one stage with its output silenced and return its measurements
+    requests_before = canvas.request_count
+    tracemalloc.start()
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    requests = canvas.request_count - requests_before
+    return {
+        "stage": name,
+        "seconds": round(elapsed, 4),
+        "requests": requests,
+        "requests_per_second": round(requests / elapsed, 1) if elapsed and requests else 0,
+        "peak_memory_mb": round(peak / 1024 / 1024, 2),
+    }
+
+
+def bench_size(size, args, work_dir):
+    from Publisher import late_penalty, publish
+    from Publisher.utils import canvas_api
+    from Publisher.utils.scheduler import RequestScheduler
+    from Publisher.utils.identity import IdentityIndex, grades_by_student
+    from Publisher.utils.late_policy import LatePolicy
+    from Publisher.utils.zyphraser import get_score_table
+
+    students = make_students(size)
+    assignments = make_assignments(args.assignments)
+    zybooks_csv = os.path.join(work_dir, f"UCSC_zybooks_{size}.csv")
+    canvas_csv = os.path.join(work_dir, f"canvas_gradebook_{size}.csv")
+    write_zybooks_csv(zybooks_csv, students, assignments)
+    write_canvas_csv(canvas_csv, students, assignments)
+
+    canvas = FakeCanvas(students, assignments, args.latency, refill_rate=args.refill_rate)
+    server, endpoint = start_server(canvas)
+    headers = {"Content-Type": "application/json", "Authorization": "Bearer benchmark"}
+    scheduler = RequestScheduler(args.max_concurrency)
+    canvas_api.response_hooks.append(scheduler.observe)
+    canvas_api.client.resize(args.max_concurrency)
+    grade_munge = load_grade_munge()
+    target = assignments[0]
+    target_name = csv_assignment_name(target)
+    options = Namespace(diff_only=False, bulk=False, batch_size=100, resume=False)
+    state = {}
+
+    def munge():
+        # The same steps as gradeMunge's main: only the name columns are loaded, the
+        # unmatched rows are copied and the updated report is streamed in chunks
+        zy_df = grade_munge.load_zybooks_names(zybooks_csv)
+        zy_df["School email"] = zy_df["School email"].str.lower()
+        canvas_df = grade_munge.load_canvas(canvas_csv)
+        canvas_df["SIS Login ID"] = canvas_df["SIS Login ID"].str.lower()
+        corrections = grade_munge.name_corrections(canvas_df, zy_df)
+        grade_munge.apply_corrections(zy_df, corrections)
+        result_df, unmatched_df = grade_munge.canvas_outputs(canvas_df, zy_df)
+        result_df.to_csv(os.path.join(work_dir, "canvas_graded_output.csv"), index=False)
+        grade_munge.copy_rows(canvas_csv, os.path.join(work_dir, "unmatched_emails.csv"), unmatched_df.index)
+        grade_munge.write_updated_zybooks(zybooks_csv, os.path.join(work_dir, "updated_zybooks.csv"), corrections)
+
+    def parse_csv():
+        state["table"] = get_score_table(zybooks_csv)
+
+    def fetch_roster():
+        state["students"] = canvas_api.get_students(COURSE_ID, headers, endpoint)
+        state["assignments"] = canvas_api.get_assignments(COURSE_ID, headers, endpoint)
+
+    def match_rows():
+        index = IdentityIndex()
+        index.refresh(state["students"])
+        state["user_ids"] = index.match_rows(state["table"])
+
+    def publish_each():
+        student_grades = grades_by_student(state["table"], target_name, state["user_ids"])
+        assignment = canvas_api.find_assignment(state["assignments"], target_name)
+        publish.publish_assignment(
+            COURSE_ID, assignment, state["students"], student_grades, headers, endpoint, scheduler, options
+        )
+
+    def publish_bulk():
+        bulk_name = csv_assignment_name(assignments[1])
+        student_grades = grades_by_student(state["table"], bulk_name, state["user_ids"])
+        bulk_options = Namespace(**dict(vars(options), bulk=True))
+        assignment = canvas_api.find_assignment(state["assignments"], bulk_name)
+        publish.publish_assignment(
+            COURSE_ID, assignment, state["students"], student_grades, headers, endpoint, scheduler, bulk_options
+        )
+
+    def late_check():
+        late_penalty.get_grades(COURSE_ID, headers, endpoint, target_name, zybooks_csv, scheduler, LatePolicy())
+
+    stages = [
+        ("munge", munge),
+        ("csv_parse", parse_csv),
+        ("roster_fetch", fetch_roster),
+        ("matching", match_rows),
+        ("publish", publish_each),
+        ("publish_bulk", publish_bulk),
+        ("late_check", late_check),
+    ]
+    try:
+        results = [measure(name, canvas, fn) for name, fn in stages]
+    finally:
+        canvas_api.response_hooks.remove(scheduler.observe)
+        server.shutdown()
+        server.server_close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the grading pipeline against a local fake Canvas")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="Roster sizes to benchmark")
+    parser.add_argument("--assignments", type=int, default=10, help="Number of assignments in the synthetic exports")
+    parser.add_argument("--latency", type=float, default=0.01, help="Seconds of simulated latency per request")
+    parser.add_argument("--refill_rate", type=float, default=400.0, help="Rate-limit units the fake Canvas restores per second")
+    parser.add_argument("--max_concurrency", type=int, default=8, help="Maximum number of Canvas requests in flight")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    report = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in args.sizes:
+            print(f"Benchmarking {size} students...")
+            report[size] = bench_size(size, args, work_dir)
+            for stage in report[size]:
+                print(
+                    f"  {stage['stage']:<14}{stage['seconds']:>10.3f}s{stage['requests']:>8} req"
+                    f"{stage['requests_per_second']:>10.1f} req/s{stage['peak_memory_mb']:>10.2f} MB"
+                )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
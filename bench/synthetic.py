@@ -0,0 +1,81 @@
+# bench/synthetic.py
+#
+# Synthetic rosters and Zybooks/Canvas exports for benchmarking.
+
+import csv
+import random
+from datetime import datetime, timedelta, timezone
+
+SECTIONS = ["01A", "01B", "01C", "01D"]
+
+
+def make_students(count, seed=0):
+    rng = random.Random(seed)
+    students = []
+    for index in range(count):
+        first_name = f"First{index}"
+        last_name = rng.choice(["Smith", "Lee", "Garcia", "Nguyen", "Patel", "Kim"]) + str(index)
+        students.append({
+            "id": 100000 + index,
+            "name": f"{first_name} {last_name}",
+            "sortable_name": f"{last_name}, {first_name}",
+            "short_name": first_name,
+            "login_id": f"student{index}@ucsc.edu",
+        })
+    return students
+
+
+def make_assignments(count):
+    due_at = datetime(2024, 10, 1, 23, 59, tzinfo=timezone.utc)
+    return [
+        {
+            "id": 5000 + index,
+            "name": f"ZyLab {index + 1}",
+            "points_possible": 10.0,
+            "due_at": (due_at + timedelta(days=7 * index)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
+        for index in range(count)
+    ]
+
+
+def csv_assignment_name(assignment):
+    # Column name the README asks for: the Canvas name without spaces
+    return assignment["name"].replace(" ", "")
+
+
+def write_zybooks_csv(path, students, assignments, seed=0, name_mismatch_rate=0.05):
+    # Zybooks report with percentage and (points) columns for every assignment
+    rng = random.Random(seed)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        header = ["Last name", "First name", "Primary email", "School email", "Student ID"]
+        for assignment in assignments:
+            name = csv_assignment_name(assignment)
+            header += [f"{assignment['name']} ({int(assignment['points_possible'])})", f"{name}(points)"]
+        writer.writerow(header)
+        for student in students:
+            last_name, first_name = student["sortable_name"].split(", ")
+            if rng.random() < name_mismatch_rate:
+                first_name = first_name.lower()
+            row = [last_name, first_name, f"personal{student['id']}@example.com", student["login_id"].upper(), student["id"]]
+            for assignment in assignments:
+                percent = rng.choice([0, 50, 80, 90, 100, 100])
+                row += [percent, percent * assignment["points_possible"] / 100]
+            writer.writerow(row)
+
+
+def write_canvas_csv(path, students, assignments, seed=0):
+    # Canvas "Export Entire Gradebook" file, including the "Points Possible" row
+    rng = random.Random(seed + 1)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            ["Student", "ID", "SIS User ID", "SIS Login ID", "Section"]
+            + [f"{assignment['name']} ({assignment['id']})" for assignment in assignments]
+        )
+        writer.writerow(["Points Possible", "", "", "", ""] + [assignment["points_possible"] for assignment in assignments])
+        for student in students:
+            writer.writerow(
+                [student["sortable_name"], student["id"], f"S{student['id']}", student["login_id"], rng.choice(SECTIONS)]
+                + [rng.choice(["", 0, 5, 10]) for _ in assignments]
+            )
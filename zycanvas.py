@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# zycanvas.py
+#
+# Single entry point for the grading tools:
+#
+#   python zycanvas.py munge                      # NameFix/gradeMunge.v3.py
+#   python zycanvas.py publish --assignment_name ZyLab1 --csv_file grade.csv
+#   python zycanvas.py late --policy per_day --rate 0.1 --assignment_name ZyLab1
+#   python zycanvas.py verify --csv_file grade.csv
+#   python zycanvas.py run                        # raw exports in NameFix/ straight to Canvas
+#   python zycanvas.py history changes 3          # grade changes since snapshot 3
+#   python zycanvas.py repl                       # many commands, one process
+#   python zycanvas.py watch                      # publish new Zybooks reports as they land
+#
+# Only the standard library is imported up front; pandas, requests and the publisher
+# modules are imported by the subcommand that needs them, so `--help` and cron runs
+# of a single subcommand start without paying for the others.
+
+import argparse
+import importlib.util
+import os
+import shlex
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CONFIG = os.path.join(ROOT, 'config.json')
+COMMANDS = ['munge', 'publish', 'run', 'late', 'verify', 'history', 'repl', 'watch']
+
+
+def with_defaults(argv, quiet):
+    # The tools default to ../config.json (relative to Publisher/); from the project
+    # root that is config.json next to this file
+    argv = list(argv)
+    if '--config' not in argv:
+        argv = ['--config', DEFAULT_CONFIG] + argv
+    if quiet and '--quiet' not in argv:
+        argv.append('--quiet')
+    return argv
+
+
+def run_munge(argv, quiet):
+    parser = argparse.ArgumentParser(prog='zycanvas munge', add_help=False)
+    parser.add_argument('--dir', default=os.path.join(ROOT, 'NameFix'), help='Directory holding the Zybooks and Canvas exports')
+    args, rest = parser.parse_known_args(argv)
+
+    # gradeMunge.v3.py is not an importable module name, so load it from its path
+    path = os.path.join(ROOT, 'NameFix', 'gradeMunge.v3.py')
+    spec = importlib.util.spec_from_file_location('grade_munge', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    # The script looks for its inputs in the working directory
+    cwd = os.getcwd()
+    os.chdir(args.dir)
+    try:
+        module.main(rest)
+    finally:
+        os.chdir(cwd)
+
+
+def run_publish(argv, quiet):
+    from Publisher import publish
+
+    publish.main(with_defaults(argv, quiet))
+
+
+def find_exports(directory):
+    # The Zybooks report starts with "UCSC" and the Canvas gradebook export with the
+    # current year, as gradeMunge.v3.py expects them; newest first when there are several
+    files = sorted(os.listdir(directory), key=lambda f: os.path.getmtime(os.path.join(directory, f)), reverse=True)
+    current_year = time.strftime('%Y')
+    zybooks = [f for f in files if f.startswith('UCSC') and f.endswith('.csv')]
+    canvas = [f for f in files if f.startswith(current_year) and f.endswith('.csv')]
+    return (
+        os.path.join(directory, zybooks[0]) if zybooks else None,
+        os.path.join(directory, canvas[0]) if canvas else None,
+    )
+
+
+def run_pipeline(argv, quiet):
+    # Publish straight from the raw exports: the Zybooks report is parsed once, its
+    # percentages converted to points, matched to the roster by school email (seeded from
+    # the Canvas export when there is one) and published, with no intermediate files
+    # unless --dump asks for them
+    parser = argparse.ArgumentParser(prog='zycanvas run', add_help=False)
+    parser.add_argument('--dir', default=os.path.join(ROOT, 'NameFix'), help='Directory holding the Zybooks and Canvas exports')
+    args, rest = parser.parse_known_args(argv)
+
+    zybooks_file, canvas_file = find_exports(args.dir)
+    if '--csv_file' not in rest:
+        if not zybooks_file:
+            print(f"A Zybooks Gradebook File has NOT been found in {args.dir}.")
+            sys.exit(1)
+        rest += ['--csv_file', zybooks_file]
+    if canvas_file and '--canvas_export' not in rest:
+        rest += ['--canvas_export', canvas_file]
+    if not {'--assignment_name', '--assignments', '--assignment_glob', '--all_assignments'} & set(rest):
+        rest.append('--all_assignments')
+    # The raw Zybooks report holds percentages; convert them with Canvas's points_possible
+    if '--percentages' not in rest:
+        rest.append('--percentages')
+    run_publish(rest, quiet)
+
+
+def run_late(argv, quiet):
+    from Publisher import late_penalty
+
+    late_penalty.main(with_defaults(argv, quiet))
+
+
+def run_history(argv, quiet):
+    from Publisher.utils import history
+
+    history.main(argv)
+
+
+def run_verify(argv, quiet):
+    parser = argparse.ArgumentParser(prog='zycanvas verify', description='Check the config, roster, assignments and CSV without publishing.')
+    parser.add_argument('--access_token', help='The Canvas API access token')
+    parser.add_argument('--config', default=DEFAULT_CONFIG, help='Path to config.json')
+    parser.add_argument('--course_id', help='The Canvas course ID')
+    parser.add_argument('--endpoint', help='The Canvas API base URL')
+    parser.add_argument('--csv_file', help='Also check this CSV against the roster and assignment list')
+    parser.add_argument('--refresh', action='store_true', help='Ignore the cached roster and assignment list and fetch them again')
+    parser.add_argument('--cache_ttl', type=int, help='Seconds before the cached roster and assignment list are revalidated')
+    parser.add_argument('--no_cache', action='store_true', help='Do not read or write the roster and assignment cache')
+    args = parser.parse_args(argv)
+
+    from Publisher.publish import load_config
+    from Publisher.utils.cache import cache_from_args
+    from Publisher.utils.canvas_api import DEFAULT_ENDPOINT, find_assignment, get_assignments, get_students
+
+    config = load_config(args.config)
+    access_token = args.access_token or config.get('access_token')
+    course_id = args.course_id or config.get('course_id')
+    if not access_token or not course_id:
+        print("Access token and course ID must be provided either via config.json or command-line arguments.")
+        sys.exit(1)
+
+    endpoint = args.endpoint or config.get('endpoint', DEFAULT_ENDPOINT)
+    headers = {'Content-Type': 'application/json', 'Authorization': f'Bearer {access_token}'}
+    cache = cache_from_args(args, config)
+    students = get_students(course_id, headers, endpoint, cache)
+    assignments = get_assignments(course_id, headers, endpoint, cache)
+    print(f"Course {course_id}: {len(students)} students, {len(assignments)} assignments.")
+
+    if not args.csv_file:
+        return
+    from Publisher.utils.identity import identity_from_args
+    from Publisher.utils.zyphraser import get_score_table
+
+    table = get_score_table(args.csv_file)
+    unknown = [name for name in table.points if find_assignment(assignments, name) is None]
+    for name in unknown:
+        print(f"CSV column '{name}(points)' has no matching Canvas assignment")
+    index = identity_from_args(args, config, course_id, endpoint)
+    index.refresh(students)
+    user_ids = index.match_rows(table)
+    index.save()
+    matched = set(user_ids) - {None}
+    missing = sum(1 for student in students if student.id not in matched)
+    print(f"{args.csv_file}: {len(table.points) - len(unknown)}/{len(table.points)} assignments found, "
+          f"{len(matched)} students matched, {user_ids.count(None)} rows unmatched, {missing} students without a row.")
+
+
+def run_repl(argv, quiet):
+    # One process for many commands: the HTTP session, the listing cache and the
+    # imported modules stay warm between commands
+    from Publisher.utils.metrics import metrics
+    from Publisher.utils.retry import dead_letters
+
+    print(f"zycanvas shell. Commands: {', '.join(name for name in COMMANDS if name not in ('repl', 'watch'))}; 'exit' to leave.")
+    while True:
+        try:
+            line = input('zycanvas> ')
+        except EOFError:
+            print()
+            break
+        try:
+            words = shlex.split(line)
+        except ValueError as e:
+            print(f"Could not parse command: {e}")
+            continue
+        if not words:
+            continue
+        if words[0] in ('exit', 'quit'):
+            break
+        if words[0] in ('repl', 'watch') or words[0] not in COMMANDS:
+            print(f"Unknown command '{words[0]}'")
+            continue
+        metrics.reset()
+        dead_letters.clear()
+        start = time.perf_counter()
+        try:
+            # Banners are skipped inside the shell
+            HANDLERS[words[0]](words[1:], True)
+        except SystemExit:
+            # argparse --help and the tools' fatal errors exit; the shell keeps going
+            pass
+        except KeyboardInterrupt:
+            print("Interrupted.")
+        except Exception as e:
+            # A network error or a bad option value ends the command, not the session
+            print(f"{words[0]} failed: {e!r}")
+        print(f"({time.perf_counter() - start:.2f}s)")
+
+
+def scan_reports(directory):
+    # (size, modification time) of every Zybooks report in the directory
+    signatures = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.startswith('UCSC') and entry.name.endswith('.csv') and entry.is_file():
+                stat = entry.stat()
+                signatures[entry.path] = (stat.st_size, stat.st_mtime_ns)
+    return signatures
+
+
+def publish_report(directory, path, argv):
+    # Publish one report like `run`; True when every grade reached Canvas
+    from Publisher.utils.metrics import metrics
+    from Publisher.utils.retry import dead_letters
+
+    print(f"Publishing {os.path.basename(path)}")
+    metrics.reset()
+    dead_letters.clear()
+    start = time.perf_counter()
+    try:
+        run_pipeline(['--dir', directory, '--csv_file', path] + argv, True)
+        published = not dead_letters
+    except SystemExit:
+        published = False
+    except Exception as e:
+        # Canvas being unreachable for a while must not end the watch; the report is
+        # tried again after --retry_delay
+        print(f"Publishing {os.path.basename(path)} failed: {e!r}")
+        published = False
+    print(f"({time.perf_counter() - start:.2f}s)")
+    return published
+
+
+def run_watch(argv, quiet):
+    # Publish every Zybooks report that lands in the directory, like `run`, but only the
+    # grades that changed since the last published snapshot (--changed_since last against
+    # the grade history). A report is picked up once its size and modification time have
+    # not changed for --settle seconds, so half-written downloads are left alone. When
+    # several are ready, only the newest is published: every report is a full gradebook
+    # and the diff covers whatever the older ones changed. A report that fails is tried
+    # again after --retry_delay seconds unless a newer one is published first; until
+    # then its changes stay unpublished in the history. The HTTP session and the cached
+    # roster stay warm between reports.
+    parser = argparse.ArgumentParser(prog='zycanvas watch', add_help=False)
+    parser.add_argument('--dir', default=os.path.join(ROOT, 'NameFix'), help='Directory to watch for Zybooks reports')
+    parser.add_argument('--interval', type=float, default=1.0, help='Seconds between directory scans')
+    parser.add_argument('--settle', type=float, default=2.0, help='Seconds a report must stay unchanged before it is published')
+    parser.add_argument('--retry_delay', type=float, default=60.0, help='Seconds before a report that failed to publish is tried again')
+    args, rest = parser.parse_known_args(argv)
+    if '--changed_since' not in rest:
+        rest += ['--changed_since', 'last']
+
+    # Reports already in the directory are not published again
+    seen = scan_reports(args.dir)
+    pending = {}
+    print(f"Watching {args.dir} for Zybooks reports (Ctrl-C to stop).")
+    try:
+        while True:
+            time.sleep(args.interval)
+            now = time.monotonic()
+            current = scan_reports(args.dir)
+            ready = []
+            for path, signature in current.items():
+                if seen.get(path) == signature:
+                    continue
+                if path not in pending or pending[path][0] != signature:
+                    # New, or still being written
+                    pending[path] = (signature, now)
+                elif now - pending[path][1] >= args.settle:
+                    ready.append(path)
+            pending = {path: entry for path, entry in pending.items() if path in current}
+            if not ready:
+                continue
+
+            newest = max(ready, key=lambda path: current[path][1])
+            if publish_report(args.dir, newest, rest):
+                # Older reports are covered by the newest one
+                for path in list(pending):
+                    if current[path][1] <= current[newest][1]:
+                        seen[path] = current[path]
+                        del pending[path]
+            else:
+                print(f"{os.path.basename(newest)} was not fully published, trying again in {args.retry_delay:.0f}s.")
+                # Ready again once --settle has passed from this point
+                pending[newest] = (current[newest], now + args.retry_delay - args.settle)
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+
+
+HANDLERS = {
+    'munge': run_munge,
+    'publish': run_publish,
+    'run': run_pipeline,
+    'late': run_late,
+    'verify': run_verify,
+    'history': run_history,
+    'repl': run_repl,
+    'watch': run_watch,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='zycanvas', description='Zybooks to Canvas grading tools.')
+    parser.add_argument('--quiet', action='store_true', help='Skip banners and introductions (headless and cron use)')
+    parser.add_argument('command', choices=COMMANDS, help='Tool to run')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='Options for the tool (see zycanvas <command> --help)')
+    args = parser.parse_args(argv)
+
+    # Run from the project root so the Publisher package imports
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    HANDLERS[args.command](args.args, args.quiet)
+
+
+if __name__ == '__main__':
+    main()